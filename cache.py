@@ -0,0 +1,234 @@
+"""
+Per user cache of top k recommendation lists. Entries expire after a TTL,
+are evicted least recently used first, and are dropped as soon as the
+user's profile changes or one of the cached posts is deleted or marked as
+a near duplicate
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Entry(object):
+
+    __slots__ = ('ranked', 'k', 'created')
+
+    def __init__(self, ranked, k, created):
+        self.ranked = ranked
+        self.k = k
+        self.created = created
+
+
+class ResultCache(object):
+    """
+    compute(user_id, k) returns the ranked [(item_id, score)] to cache,
+    e.g. Pipeline.recommend. An entry younger than ttl seconds is served
+    as is. One younger than ttl + stale_ttl is still served, while a
+    background refresh recomputes it on executor. A cached list of k items
+    also answers requests for fewer.
+
+    Invalidation is event driven: call profile_changed(user_id) after
+    ProfileStore.add_post and item_removed(item_id) when a post is deleted
+    or becomes a duplicate. Results computed while an invalidation for
+    them happened are returned but not cached
+    """
+
+    def __init__(self, compute, ttl=300.0, stale_ttl=0.0, maxsize=10000,
+                 executor=None, clock=time.monotonic):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.compute = compute
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.executor = executor
+        self.clock = clock
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._item_users = {}
+        self._computing = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def get(self, user_id, k=10):
+        """ Top k [(item_id, score)] for user_id, cached when possible """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.k >= k:
+                age = now - entry.created
+                if age < self.ttl:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return entry.ranked[:k]
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(user_id)
+                    self.stale_hits += 1
+                    if user_id not in self._refreshing:
+                        self._refreshing.add(user_id)
+                        self._submit(user_id, entry.k)
+                    return entry.ranked[:k]
+            self.misses += 1
+            token = self._computing[user_id] = object()
+        return self._compute(user_id, k, token)
+
+    def _submit(self, user_id, k):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(2)
+        token = self._computing[user_id] = object()
+        self.executor.submit(self._refresh, user_id, k, token)
+
+    def _refresh(self, user_id, k, token):
+        try:
+            self._compute(user_id, k, token)
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
+
+    def _compute(self, user_id, k, token):
+        try:
+            ranked = list(self.compute(user_id, k))
+        except Exception:
+            with self._lock:
+                if self._computing.get(user_id) is token:
+                    del self._computing[user_id]
+            raise
+        with self._lock:
+            # an invalidation during compute replaced or dropped the token
+            if self._computing.get(user_id) is token:
+                del self._computing[user_id]
+                self._store(user_id, ranked, k)
+        return ranked
+
+    def _store(self, user_id, ranked, k):
+        self._unlink(user_id)
+        self._entries[user_id] = _Entry(ranked, k, self.clock())
+        self._entries.move_to_end(user_id)
+        for item_id, _ in ranked:
+            self._item_users.setdefault(item_id, set()).add(user_id)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._unlink(oldest)
+            self.evictions += 1
+
+    def _unlink(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        for item_id, _ in entry.ranked:
+            users = self._item_users.get(item_id)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._item_users[item_id]
+        return True
+
+    def profile_changed(self, user_id):
+        """ Drop the user's entry; their profile no longer matches it """
+        with self._lock:
+            self._computing.pop(user_id, None)
+            if self._unlink(user_id):
+                self.invalidations += 1
+
+    def item_removed(self, item_id):
+        """ Drop every entry listing item_id, deleted or now a duplicate """
+        with self._lock:
+            # in flight results may list the item too
+            self._computing.clear()
+            for user_id in self._item_users.pop(item_id, ()):
+                if self._unlink(user_id):
+                    self.invalidations += 1
+
+    def clear(self):
+        """ Drop all entries and reset the counters """
+        with self._lock:
+            self._entries.clear()
+            self._item_users.clear()
+            self._computing.clear()
+            self.hits = self.stale_hits = self.misses = 0
+            self.evictions = self.invalidations = 0
+
+    def info(self):
+        return {'hits': self.hits, 'stale_hits': self.stale_hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+if __name__ == "__main__":
+    now = [0.0]
+    calls = []
+    during = []
+
+    def compute(user_id, k):
+        calls.append(user_id)
+        version = len(calls)
+        # simulate events arriving while the result is being computed
+        while during:
+            during.pop()()
+        return [('%s-post%d' % (user_id, n), float(version))
+                for n in range(k)]
+
+    executor = ThreadPoolExecutor(1)
+
+    def drain():
+        executor.submit(lambda: None).result()
+
+    cache = ResultCache(compute, ttl=10, stale_ttl=5, maxsize=2,
+                        executor=executor, clock=lambda: now[0])
+    first = cache.get('a', 3)
+    assert cache.get('a', 2) == first[:2] and calls == ['a']
+    assert cache.get('a', 5) != first and calls == ['a', 'a']
+
+    # a stale entry is served while a background refresh replaces it
+    now[0] = 12
+    stale = cache.get('a', 5)
+    drain()
+    assert stale[0][1] == 2.0 and cache.get('a', 5)[0][1] == 3.0
+    assert cache.info()['stale_hits'] == 1
+
+    # a profile change during the refresh keeps its result out of the cache
+    now[0] = 24
+    during.append(lambda: cache.profile_changed('a'))
+    cache.get('a', 5)
+    drain()
+    assert 'a' not in cache
+
+    # an item removed during a compute is not cached either
+    during.append(lambda: cache.item_removed('nothing'))
+    cache.get('b', 2)
+    assert 'b' not in cache
+    cache.get('b', 2)
+    assert 'b' in cache
+
+    # removed items and profile changes drop exactly the entries concerned
+    cache.get('c', 2)
+    cache.item_removed('b-post1')
+    assert 'b' not in cache and 'c' in cache
+    cache.get('b', 2)
+    cache.profile_changed('c')
+    assert 'c' not in cache and 'b' in cache
+
+    # least recently used entries are evicted, expired ones recomputed
+    cache.get('c', 2)
+    cache.get('b', 2)
+    cache.get('d', 2)
+    assert 'c' not in cache and len(cache) == 2
+    assert cache.info()['evictions'] == 1
+    count = len(calls)
+    now[0] = 100
+    cache.get('b', 2)
+    assert len(calls) == count + 1
+    executor.shutdown()
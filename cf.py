@@ -0,0 +1,208 @@
+"""
+Collaborative filtering over activity interactions: implicit feedback
+matrix factorization with alternating least squares (Hu, Koren, Volinsky)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from similarity import top_k
+
+
+class Interactions(object):
+    """
+    Weighted user x item interaction counts with stable integer rows and
+    columns. Items can be posts, or other users for circle interactions
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.items = {}
+        self.user_ids = []
+        self.item_ids = []
+        self.counts = {}
+
+    def _row(self, ids, index, key):
+        position = index.get(key)
+        if position is None:
+            position = index[key] = len(ids)
+            ids.append(key)
+        return position
+
+    def add(self, user_id, item_id, weight=1.0):
+        key = (self._row(self.user_ids, self.users, user_id),
+               self._row(self.item_ids, self.items, item_id))
+        self.counts[key] = self.counts.get(key, 0.0) + weight
+
+    def add_activity(self, user_id, item, reshare_weight=2.0):
+        """
+        Record an activity feed item of user_id: the post itself, and for
+        a reshare the original post, which counts for more
+        """
+        if item.get('id'):
+            self.add(user_id, item['id'])
+        obj = item.get('object') or {}
+        if item.get('verb') == 'share' and obj.get('id'):
+            self.add(user_id, obj['id'], reshare_weight)
+
+    def matrix(self):
+        """ CSR users x items matrix of the counts """
+        if not self.counts:
+            return sparse.csr_matrix((len(self.user_ids), len(self.item_ids)),
+                                     dtype=np.float32)
+        rows, cols = zip(*self.counts)
+        return sparse.csr_matrix(
+            (np.fromiter(self.counts.values(), dtype=np.float32,
+                         count=len(self.counts)), (rows, cols)),
+            shape=(len(self.user_ids), len(self.item_ids)))
+
+
+def _solve_rows(confidence, fixed, gram, regularization, out, rows):
+    """
+    Least squares update of the given rows of out against the fixed
+    factors, with preference 1 and confidence 1 + confidence[u, i] for
+    observed pairs and preference 0, confidence 1 elsewhere
+    """
+    identity = regularization * np.eye(fixed.shape[1])
+    indptr, indices, data = confidence.indptr, confidence.indices, \
+        confidence.data
+    for row in rows:
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            out[row] = 0
+            continue
+        observed = fixed[indices[start:end]]
+        extra = data[start:end]
+        a = gram + (observed.T * extra).dot(observed) + identity
+        b = observed.T.dot(1.0 + extra)
+        out[row] = np.linalg.solve(a, b)
+
+
+class ImplicitALS(object):
+    """
+    Factorizes an Interactions matrix into user and item factors.
+    Confidence is 1 + alpha * count. Each half step solves one small
+    factors x factors system per row; rows are split over a thread pool
+    (NumPy releases the GIL in the solver). fit() warm starts from the
+    factors of the previous fit for users and items seen before
+    """
+
+    def __init__(self, factors=32, regularization=0.01, alpha=40.0,
+                 iterations=10, workers=None, seed=0):
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.iterations = iterations
+        self.workers = workers
+        self._random = np.random.RandomState(seed)
+        self.user_ids = []
+        self.item_ids = []
+        self.users = {}
+        self.user_factors = np.zeros((0, factors))
+        self.item_factors = np.zeros((0, factors))
+        self._seen = None
+
+    def _initial(self, ids, old_ids, old_factors):
+        factors = self._random.normal(0, 0.01, (len(ids), self.factors))
+        position = dict((key, i) for i, key in enumerate(old_ids))
+        for i, key in enumerate(ids):
+            old = position.get(key)
+            if old is not None:
+                factors[i] = old_factors[old]
+        return factors
+
+    def _half_step(self, pool, confidence, fixed, out):
+        gram = fixed.T.dot(fixed)
+        chunks = np.array_split(np.arange(out.shape[0]),
+                                max(1, 4 * (self.workers or 4)))
+        futures = [pool.submit(_solve_rows, confidence, fixed, gram,
+                               self.regularization, out, chunk)
+                   for chunk in chunks if len(chunk)]
+        for future in futures:
+            future.result()
+
+    def fit(self, interactions):
+        user_item = interactions.matrix()
+        user_item.sum_duplicates()
+        users = self._initial(interactions.user_ids, self.user_ids,
+                              self.user_factors)
+        items = self._initial(interactions.item_ids, self.item_ids,
+                              self.item_factors)
+
+        confidence = (user_item * self.alpha).tocsr()
+        confidence_t = confidence.T.tocsr()
+        with ThreadPoolExecutor(self.workers) as pool:
+            for _ in range(self.iterations):
+                self._half_step(pool, confidence, items, users)
+                self._half_step(pool, confidence_t, users, items)
+
+        self.user_ids = list(interactions.user_ids)
+        self.item_ids = list(interactions.item_ids)
+        self.users = dict(interactions.users)
+        self.user_factors = users
+        self.item_factors = items
+        self._seen = user_item
+        return self
+
+    def scores(self, user_ids):
+        """ Dense len(user_ids) x items score matrix, one batched product """
+        rows = [self.users[user_id] for user_id in user_ids]
+        return self.user_factors[rows].dot(self.item_factors.T)
+
+    def recommend(self, user_ids, k=10, exclude_seen=True):
+        """ [(item_id, score)] top k lists for a batch of known users """
+        scores = self.scores(user_ids)
+        results = []
+        for i, user_id in enumerate(user_ids):
+            row_scores = scores[i]
+            if exclude_seen:
+                row = self.users[user_id]
+                seen = self._seen.indices[self._seen.indptr[row]:
+                                          self._seen.indptr[row + 1]]
+                row_scores[seen] = -np.inf
+            results.append([(self.item_ids[j], float(row_scores[j]))
+                            for j in top_k(row_scores, k)])
+        return results
+
+
+if __name__ == "__main__":
+    # two clusters of users, each interacting with most of its own items
+    interactions = Interactions()
+    for u in range(20):
+        prefix = 'ab'[u // 10]
+        for j in range(10):
+            if (u + j) % 4:
+                interactions.add('u%d' % u, '%s%d' % (prefix, j))
+
+    model = ImplicitALS(factors=4, iterations=15, workers=2)
+    try:
+        model.recommend(['u0'])
+        assert False, "unknown user before fit"
+    except KeyError:
+        pass
+
+    model.fit(interactions)
+    assert model.scores(['u0', 'u10']).shape == (2, 20)
+    for u in range(20):
+        prefix = 'ab'[u // 10]
+        ranked = model.recommend(['u%d' % u], k=2)[0]
+        # the held out items of the user's own cluster come first
+        assert len(ranked) == 2
+        assert all(item_id[0] == prefix for item_id, _ in ranked)
+        assert all(int(item_id[1:]) % 4 == (-u) % 4 for item_id, _ in ranked)
+
+    # warm start: known users and items keep their factors, rows stay put
+    user_factors = model.user_factors.copy()
+    item_factors = model.item_factors.copy()
+    interactions.add('new', 'a0')
+    model.iterations = 0
+    model.fit(interactions)
+    assert model.user_ids[-1] == 'new' and model.users['new'] == 20
+    assert np.array_equal(model.user_factors[:20], user_factors)
+    assert np.array_equal(model.item_factors, item_factors)
+    model.iterations = 2
+    model.fit(interactions)
+    assert all(item_id[0] == 'a' for item_id, _ in
+               model.recommend(['u1'], k=2)[0])
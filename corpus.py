@@ -0,0 +1,168 @@
+"""
+Corpus level stemming of whole activity dumps over a process pool
+"""
+
+import os
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from lexicon import StemLexicon
+from stem import IndonesianStemmer
+
+
+# One stemmer per worker process, built once by the pool initializer
+_stemmer = None
+
+
+def init_worker(cache_size, lexicon_path=None):
+    global _stemmer
+    lexicon = StemLexicon(lexicon_path) if lexicon_path else None
+    _stemmer = IndonesianStemmer(cache_size=cache_size, lexicon=lexicon)
+
+
+def _stem_chunk(documents):
+    """
+    Stem a chunk of documents inside a worker. Instead of a list of strings
+    per document the result is (vocab, lengths, ids): the distinct stems of
+    the chunk, an array('I') of token counts per document and an
+    array('I') of stem ids for all tokens of the chunk
+    """
+    lengths = array('I')
+    tokens = []
+    for document in documents:
+        words = document.split()
+        lengths.append(len(words))
+        tokens.extend(words)
+
+    forms, stems, index = _stemmer.stem_tokens(tokens)
+
+    vocab = []
+    stem_ids = {}
+    form_ids = array('I')
+    for stem in stems:
+        stem_id = stem_ids.get(stem)
+        if stem_id is None:
+            stem_id = stem_ids[stem] = len(vocab)
+            vocab.append(stem)
+        form_ids.append(stem_id)
+
+    ids = array('I', [form_ids[i] for i in index])
+    return vocab, lengths, ids
+
+
+def _chunks(documents, chunksize):
+    documents = iter(documents)
+    while True:
+        chunk = list(islice(documents, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_stemmed_chunks(documents, max_workers=None, chunksize=256,
+                        cache_size=10000, executor=None, lexicon_path=None):
+    """
+    Stem documents (plain text, e.g. strip_tags output) across a process
+    pool and yield the compact (vocab, lengths, ids) result of every chunk,
+    in input order. Only a few chunks per worker are in flight at a time,
+    so documents may be a lazy iterable over a large dump. Pass executor to
+    reuse a pool; it must have been created with init_worker as initializer.
+    lexicon_path points workers at a shared lexicon built by build_lexicon
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers,
+                                       initializer=init_worker,
+                                       initargs=(cache_size, lexicon_path))
+    try:
+        window = 2 * (max_workers or os.cpu_count() or 1)
+        pending = deque()
+        for chunk in _chunks(documents, chunksize):
+            pending.append(executor.submit(_stem_chunk, chunk))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def stem_corpus(documents, max_workers=None, chunksize=256, cache_size=10000,
+                executor=None, lexicon_path=None):
+    """
+    Parallel equivalent of the notebook's parseOutText over many documents:
+    yields the space separated stems of each document, in input order
+    """
+    for vocab, lengths, ids in iter_stemmed_chunks(
+            documents, max_workers, chunksize, cache_size, executor,
+            lexicon_path):
+        start = 0
+        for length in lengths:
+            end = start + length
+            yield ' '.join([vocab[i] for i in ids[start:end]])
+            start = end
+
+
+def encode_corpus(documents, vocabulary, max_workers=None, chunksize=256,
+                  cache_size=10000, executor=None, lexicon_path=None):
+    """
+    Like stem_corpus, but yields every document as an array('I') of ids
+    of vocabulary (a vocab.Vocabulary), interning new stems, instead of a
+    string. Ready for TfidfIndex.add_document
+    """
+    for vocab, lengths, ids in iter_stemmed_chunks(
+            documents, max_workers, chunksize, cache_size, executor,
+            lexicon_path):
+        global_ids = vocabulary.encode(vocab)
+        start = 0
+        for length in lengths:
+            end = start + length
+            yield array('I', [global_ids[i] for i in ids[start:end]])
+            start = end
+
+
+if __name__ == "__main__":
+    import random
+    import shutil
+    import tempfile
+
+    from lexicon import build_lexicon
+    from stem import stem_word
+    from vocab import Vocabulary
+
+    rnd = random.Random(0)
+    words = [u'makanan', u'berlari', u'dimakan', u'pembelajaran',
+             u'ketidakadilan', u'menyanyikan', u'bukunya', u'kami', u'rumah',
+             u'perjalanan', u'ditulis', u'berkelahi', u'menemukan']
+    # includes empty documents, which must keep their place in the output
+    documents = [u' '.join(rnd.choice(words)
+                           for _ in range(rnd.randint(0, 12)))
+                 for _ in range(203)]
+    expected = [u' '.join(stem_word(word) for word in document.split())
+                for document in documents]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        lexicon_path = os.path.join(tmp, 'stems.lex')
+        build_lexicon(words[:6], lexicon_path)
+        for path in (None, lexicon_path):
+            assert list(stem_corpus(iter(documents), max_workers=3,
+                                    chunksize=7, lexicon_path=path)) == \
+                expected
+
+        vocabulary = Vocabulary()
+        encoded = list(encode_corpus(documents, vocabulary, max_workers=2,
+                                     chunksize=5))
+        assert [vocabulary.decode(ids) for ids in encoded] == \
+            [document.split() for document in expected]
+        assert len(vocabulary) == len(set(stem_word(word) for word in words))
+
+        with ProcessPoolExecutor(2, initializer=init_worker,
+                                 initargs=(16,)) as executor:
+            assert list(stem_corpus(documents, max_workers=2, chunksize=3,
+                                    executor=executor)) == expected
+    finally:
+        shutil.rmtree(tmp)
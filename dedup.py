@@ -0,0 +1,320 @@
+"""
+Near duplicate detection for reshared and copied posts: MinHash signatures
+over shingles of stemmed tokens and an LSH banding index
+"""
+
+import zlib
+
+import numpy as np
+
+
+# Mersenne prime for the universal hash family. Shingle hashes and the
+# coefficients stay below it, so a * x + b fits in 64 bits
+_PRIME = (1 << 31) - 1
+
+
+def shingles(tokens, size=3):
+    """
+    Set of the size-token shingles of a stemmed token sequence. Shorter
+    sequences give a single shingle of all their tokens
+    """
+    tokens = list(tokens)
+    if len(tokens) <= size:
+        return set([u' '.join(tokens)]) if tokens else set()
+    return set(u' '.join(tokens[i:i + size])
+               for i in range(len(tokens) - size + 1))
+
+
+def _shingle_hashes(shingle_set):
+    # crc32 rather than hash() so signatures agree across processes
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) % _PRIME
+                        for s in shingle_set),
+                       dtype=np.uint64, count=len(shingle_set))
+
+
+class MinHasher(object):
+    """ num_perm MinHash functions (a * x + b) mod p from a fixed seed """
+
+    def __init__(self, num_perm=128, seed=1):
+        rnd = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rnd.randint(1, _PRIME, num_perm).astype(np.uint64)
+        self._b = rnd.randint(0, _PRIME, num_perm).astype(np.uint64)
+
+    def signature(self, shingle_set):
+        """
+        MinHash signature of a set of shingles, as a uint64 array. The
+        empty set gets all _PRIME, a value no real hash reaches (see
+        is_empty_signature)
+        """
+        if not shingle_set:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        hashes = _shingle_hashes(shingle_set)
+        values = (np.outer(self._a, hashes) + self._b[:, None]) % _PRIME
+        return values.min(axis=1)
+
+
+def is_empty_signature(signature):
+    """ True for the signature of an empty shingle set """
+    return int(signature[0]) == _PRIME
+
+
+def estimate_jaccard(signature, other):
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Number of bands b (dividing num_perm) whose LSH threshold
+    (1 / b) ** (1 / r) is closest to threshold
+    """
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands)
+    return best[1]
+
+
+class LSHIndex(object):
+    """
+    Banding index: signatures are cut into bands and two keys become
+    candidates when any whole band matches, found with one dict lookup per
+    band instead of a comparison with every stored signature
+    """
+
+    def __init__(self, num_perm=128, bands=32):
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.tables = [{} for _ in range(bands)]
+        self.signatures = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [signature[i * rows:(i + 1) * rows].tobytes()
+                for i in range(self.bands)]
+
+    def add(self, key, signature):
+        if key in self.signatures:
+            self.remove(key)
+        self.signatures[key] = signature
+        for table, band in zip(self.tables, self._band_keys(signature)):
+            table.setdefault(band, set()).add(key)
+
+    def remove(self, key):
+        signature = self.signatures.pop(key)
+        for table, band in zip(self.tables, self._band_keys(signature)):
+            bucket = table[band]
+            bucket.discard(key)
+            if not bucket:
+                del table[band]
+
+    def candidates(self, signature):
+        """ Keys sharing at least one band with signature """
+        found = set()
+        for table, band in zip(self.tables, self._band_keys(signature)):
+            bucket = table.get(band)
+            if bucket:
+                found.update(bucket)
+        return found
+
+
+class NearDuplicateDetector(object):
+    """
+    Groups posts whose shingle sets have an estimated Jaccard similarity
+    of at least threshold. The first post of a group is its canonical
+    post; only canonical posts are kept in the LSH index.
+
+        canonical = detector.add(post_id, tokens)
+        if canonical == post_id:
+            index.add_document(post_id, tokens)   # not a duplicate
+        ...
+        results = detector.collapse(index_results)
+
+    Removing a canonical post, or editing it so its signature changes,
+    regroups its duplicates; those that become canonical are returned by
+    remove() and passed to on_promote(key), so they can be indexed too
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=None,
+                 shingle_size=3, seed=1, on_promote=None):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm, seed)
+        self.lsh = LSHIndex(num_perm, bands or choose_bands(num_perm,
+                                                           threshold))
+        self.on_promote = on_promote
+        self.canonical = {}
+        # signature of every post, and the duplicates of every canonical
+        # post in the order they were added
+        self.signatures = {}
+        self.members = {}
+
+    def signature(self, tokens):
+        return self.hasher.signature(shingles(tokens, self.shingle_size))
+
+    def find(self, tokens=None, signature=None):
+        """
+        Canonical key of an indexed near duplicate of tokens, or None.
+        Posts without shingles (image only, all stop words) duplicate
+        nothing
+        """
+        if signature is None:
+            signature = self.signature(tokens)
+        if is_empty_signature(signature):
+            return None
+        best = None
+        for key in self.lsh.candidates(signature):
+            similarity = estimate_jaccard(signature, self.lsh.signatures[key])
+            if similarity >= self.threshold and \
+               (best is None or similarity > best[0]):
+                best = (similarity, key)
+        return best[1] if best else None
+
+    def add(self, key, tokens):
+        """
+        Register a post. Returns the key of the canonical post it
+        duplicates, or key itself when it starts a new group. Posts
+        without shingles always start their own group and are not indexed.
+        Adding a known post again with changed tokens, such as an edited
+        post, moves it to the group its new tokens belong to
+        """
+        signature = self.signature(tokens)
+        if key in self.canonical:
+            if np.array_equal(signature, self.signatures[key]):
+                return self.canonical[key]
+            self.remove(key)
+        return self._register(key, signature)
+
+    def _register(self, key, signature):
+        canonical = self.find(signature=signature)
+        if canonical is None:
+            canonical = key
+            if not is_empty_signature(signature):
+                self.lsh.add(key, signature)
+        else:
+            self.members.setdefault(canonical, {})[key] = None
+        self.canonical[key] = canonical
+        self.signatures[key] = signature
+        return canonical
+
+    def is_duplicate(self, key):
+        return self.canonical.get(key, key) != key
+
+    def remove(self, key):
+        """
+        Forget a post. The duplicates of a removed canonical post are
+        registered again in the order they were added; returns those that
+        became canonical
+        """
+        canonical = self.canonical.pop(key, None)
+        if canonical is None:
+            return []
+        del self.signatures[key]
+        if canonical != key:
+            members = self.members[canonical]
+            del members[key]
+            if not members:
+                del self.members[canonical]
+            return []
+
+        if key in self.lsh:
+            self.lsh.remove(key)
+        promoted = []
+        for other in self.members.pop(key, ()):
+            del self.canonical[other]
+            if self._register(other, self.signatures.pop(other)) == other:
+                promoted.append(other)
+                if self.on_promote is not None:
+                    self.on_promote(other)
+        return promoted
+
+    def collapse(self, ranked):
+        """
+        Keep only the best ranked post of every duplicate group in a
+        ranked list of (key, score), preserving order
+        """
+        seen = set()
+        result = []
+        for key, score in ranked:
+            group = self.canonical.get(key, key)
+            if group not in seen:
+                seen.add(group)
+                result.append((key, score))
+        return result
+
+
+if __name__ == "__main__":
+    import random
+
+    rnd = random.Random(0)
+    vocabulary = [u'kata%d' % n for n in range(500)]
+
+    def post(length=40):
+        return [rnd.choice(vocabulary) for _ in range(length)]
+
+    def edit(tokens, changes):
+        tokens = list(tokens)
+        for _ in range(changes):
+            tokens[rnd.randrange(len(tokens))] = rnd.choice(vocabulary)
+        return tokens
+
+    assert shingles([u'a', u'b']) == set([u'a b'])
+    assert shingles([]) == set()
+    hasher = MinHasher(256)
+    a, b = set(range(100)), set(range(20, 120))
+    estimate = estimate_jaccard(hasher.signature(set(map(str, a))),
+                                hasher.signature(set(map(str, b))))
+    assert abs(estimate - 80.0 / 120) < 0.1
+    assert choose_bands(128, 0.8) in (8, 16)
+
+    promoted = []
+    detector = NearDuplicateDetector(on_promote=promoted.append)
+    original = post()
+    assert detector.add('p1', original) == 'p1'
+    assert detector.add('p2', edit(original, 1)) == 'p1'
+    assert detector.add('p3', list(original)) == 'p1'
+    assert detector.add('other', post()) == 'other'
+    assert detector.is_duplicate('p2') and not detector.is_duplicate('p1')
+
+    # posts without shingles never group, and are not indexed
+    assert detector.add('image1', []) == 'image1'
+    assert detector.add('image2', []) == 'image2'
+    assert 'image1' not in detector.lsh
+    assert detector.collapse([('image1', 1.0), ('image2', 0.9)]) == \
+        [('image1', 1.0), ('image2', 0.9)]
+    assert detector.remove('image1') == []
+
+    ranked = [('p2', 3.0), ('other', 2.0), ('p1', 1.0), ('p3', 0.5)]
+    assert detector.collapse(ranked) == [('p2', 3.0), ('other', 2.0)]
+
+    # adding an unchanged post again keeps it where it is, an edited one
+    # moves to the group of its new content
+    assert detector.add('p3', list(original)) == 'p1'
+    rewritten = post()
+    assert detector.add('p3', rewritten) == 'p3'
+    assert detector.add('p4', rewritten) == 'p3'
+    assert detector.members == {'p1': {'p2': None}, 'p3': {'p4': None}}
+
+    # removing a canonical post promotes its first duplicate
+    assert detector.remove('p1') == ['p2'] and promoted == ['p2']
+    assert detector.canonical['p2'] == 'p2' and 'p2' in detector.lsh
+    assert detector.add('p5', list(original)) == 'p2'
+    assert detector.remove('p5') == [] and detector.remove('p5') == []
+    assert 'p1' not in detector.signatures and 'p1' not in detector.lsh
+
+    # editing a canonical post away from its group promotes a duplicate
+    assert detector.add('p3', post()) == 'p3'
+    assert promoted == ['p2', 'p4'] and detector.canonical['p4'] == 'p4'
+    assert len(detector.lsh) == 4
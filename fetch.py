@@ -0,0 +1,381 @@
+"""
+Asynchronous fetcher for the dilingkari activity endpoint: bounded
+concurrency, keep-alive connection pooling, retries with backoff and a per
+host rate limit, using plain asyncio streams
+"""
+
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlencode, urlsplit
+
+
+DEFAULT_URL = "http://dilingkari-1x.appspot.com/a"
+
+# responses worth retrying, besides connection errors and timeouts
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class FetchError(Exception):
+    def __init__(self, message, status=None):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class RateLimiter(object):
+    """
+    Token bucket allowing rate requests per second with bursts of burst
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP/1.1 connections to one host, at most maxsize open
+    """
+
+    def __init__(self, host, port, ssl=False, maxsize=8):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self._idle = []
+        self._slots = asyncio.Semaphore(maxsize)
+
+    async def request(self, method, path, body=b'', headers=None):
+        """
+        Send one request and return (status, headers, body). When an idle
+        connection fails before the status line arrives the server has
+        most likely closed it, so the request is sent once more on a new
+        connection
+        """
+        await self._slots.acquire()
+        try:
+            reused = bool(self._idle)
+            if reused:
+                reader, writer = self._idle.pop()
+            else:
+                reader, writer = await self._connect()
+            try:
+                try:
+                    status_line = await self._send(reader, writer, method,
+                                                   path, body, headers or {})
+                except (OSError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    writer.close()
+                    reader, writer = await self._connect()
+                    status_line = await self._send(reader, writer, method,
+                                                   path, body, headers or {})
+                status, response_headers, data, keep_alive = \
+                    await self._receive(reader, status_line)
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, response_headers, data
+        finally:
+            self._slots.release()
+
+    def _connect(self):
+        return asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+    async def _send(self, reader, writer, method, path, body, headers):
+        """ Write the request and return the status line of the response """
+        lines = ['%s %s HTTP/1.1' % (method, path),
+                 'Host: %s' % self.host,
+                 'Connection: keep-alive',
+                 'Content-Length: %d' % len(body)]
+        lines.extend('%s: %s' % item for item in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        return status_line
+
+    async def _receive(self, reader, status_line):
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        connection = response_headers.get('connection', '').lower()
+        keep_alive = connection != 'close' and \
+            (version != 'HTTP/1.0' or connection == 'keep-alive')
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = await self._read_chunked(reader)
+        elif 'content-length' in response_headers:
+            data = await reader.readexactly(
+                int(response_headers['content-length']))
+        else:
+            data = await reader.read()
+            keep_alive = False
+        return int(status), response_headers, data, keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        return b''.join(chunks)
+
+    def close(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            writer.close()
+
+
+class ActivityFetcher(object):
+    """
+    Fetch the activity pages of many users concurrently.
+
+        async with ActivityFetcher(concurrency=16, rate=20) as fetcher:
+            async for user_id, item in fetcher.iter_items(user_ids):
+                ...
+
+    Users whose page still fails after the retries are recorded in
+    self.failed (user id -> exception) and skipped
+    """
+
+    def __init__(self, url=DEFAULT_URL, concurrency=8, rate=10.0, burst=None,
+                 retries=3, backoff=0.5, timeout=30.0):
+        parts = urlsplit(url)
+        self.url = url
+        self.path = (parts.path or '/') + ('?' + parts.query
+                                           if parts.query else '')
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.failed = {}
+
+        ssl = parts.scheme == 'https'
+        host = parts.hostname
+        port = parts.port or (443 if ssl else 80)
+        self._pools = {host: ConnectionPool(host, port, ssl, concurrency)}
+        self._limiters = {host: RateLimiter(rate, burst or concurrency)}
+        self._host = host
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
+
+    async def fetch_page(self, user_id):
+        """ Return the decoded activity page of user_id """
+        body = urlencode({"id": user_id}).encode('ascii')
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        pool = self._pools[self._host]
+        limiter = self._limiters[self._host]
+
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            try:
+                status, _, data = await asyncio.wait_for(
+                    pool.request('POST', self.path, body, headers),
+                    self.timeout)
+                if status == 200:
+                    return json.loads(data.decode('utf-8'))
+                error = FetchError("HTTP %d for id %s" % (status, user_id),
+                                   status)
+                if status not in RETRY_STATUSES:
+                    raise error
+            except (OSError, asyncio.TimeoutError,
+                    asyncio.IncompleteReadError) as e:
+                error = e
+            if attempt >= self.retries:
+                raise error
+            await asyncio.sleep(self.backoff * 2 ** attempt *
+                                random.uniform(0.5, 1.5))
+            attempt += 1
+
+    async def iter_items(self, user_ids):
+        """
+        Yield (user_id, item) for every item of every user's page as pages
+        arrive. user_ids may be a regular or an asynchronous iterable
+        """
+        todo = asyncio.Queue(self.concurrency)
+        done = asyncio.Queue()
+
+        async def produce():
+            try:
+                if hasattr(user_ids, '__aiter__'):
+                    async for user_id in user_ids:
+                        await todo.put(user_id)
+                else:
+                    for user_id in user_ids:
+                        await todo.put(user_id)
+            finally:
+                for _ in range(self.concurrency):
+                    await todo.put(None)
+
+        async def work():
+            try:
+                while True:
+                    user_id = await todo.get()
+                    if user_id is None:
+                        break
+                    try:
+                        page = await self.fetch_page(user_id)
+                        items = page.get('items') or []
+                    except Exception as e:
+                        self.failed[user_id] = e
+                        continue
+                    await done.put((user_id, items))
+            finally:
+                done.put_nowait(None)
+
+        tasks = [asyncio.ensure_future(produce())]
+        tasks.extend(asyncio.ensure_future(work())
+                     for _ in range(self.concurrency))
+        try:
+            running = self.concurrency
+            while running:
+                result = await done.get()
+                if result is None:
+                    running -= 1
+                    continue
+                user_id, items = result
+                for item in items:
+                    yield user_id, item
+            await tasks[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+if __name__ == "__main__":
+    from urllib.parse import parse_qs
+
+    async def self_check():
+        """ Run the fetcher against a local stand-in of the endpoint """
+        stats = {'connections': 0, 'open': 0, 'requests': 0,
+                 'idle_timeout': 5.0}
+        attempts = {}
+
+        def respond(user_id):
+            attempts[user_id] = attempts.get(user_id, 0) + 1
+            if user_id == 'flaky' and attempts[user_id] == 1:
+                return 503, b'{}'
+            if user_id == 'null':
+                return 200, b'null'
+            items = [{'id': '%s-%d' % (user_id, n)} for n in range(2)]
+            return 200, json.dumps({'items': items}).encode('utf-8')
+
+        async def serve(reader, writer):
+            stats['connections'] += 1
+            stats['open'] += 1
+            try:
+                while True:
+                    try:
+                        line = await asyncio.wait_for(reader.readline(),
+                                                      stats['idle_timeout'])
+                    except asyncio.TimeoutError:
+                        break
+                    if not line:
+                        break
+                    length = 0
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        if name.lower() == 'content-length':
+                            length = int(value)
+                    body = await reader.readexactly(length)
+                    stats['requests'] += 1
+                    user_id = parse_qs(body.decode('ascii'))['id'][0]
+                    status, payload = respond(user_id)
+                    writer.write(b'HTTP/1.1 %d X\r\nContent-Length: %d\r\n\r\n'
+                                 % (status, len(payload)) + payload)
+                    await writer.drain()
+            finally:
+                stats['open'] -= 1
+                writer.close()
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        url = 'http://127.0.0.1:%d/a' % port
+
+        async def collect(fetcher, user_ids):
+            return [item async for item in fetcher.iter_items(user_ids)]
+
+        # keep-alive: 40 users over at most 4 connections
+        async with ActivityFetcher(url, concurrency=4, rate=1000) as fetcher:
+            users = ['u%d' % n for n in range(40)]
+            items = await asyncio.wait_for(collect(fetcher, users), 10)
+            assert sorted(item['id'] for _, item in items) == \
+                sorted('%s-%d' % (u, n) for u in users for n in range(2))
+            assert stats['connections'] <= 4 and stats['requests'] == 40
+            assert not fetcher.failed
+
+        # 503 is retried, a page that is not an object fails without a hang
+        async with ActivityFetcher(url, concurrency=2, rate=1000,
+                                   retries=1, backoff=0.01) as fetcher:
+            items = await asyncio.wait_for(
+                collect(fetcher, ['flaky', 'null', 'ok']), 10)
+            assert sorted(item['id'] for _, item in items) == \
+                ['flaky-0', 'flaky-1', 'ok-0', 'ok-1']
+            assert attempts['flaky'] == 2
+            assert list(fetcher.failed) == ['null']
+
+        # idle connections the server timed out are replaced, not retried
+        stats['idle_timeout'] = 0.2
+        async with ActivityFetcher(url, concurrency=2, rate=1000,
+                                   retries=0) as fetcher:
+            await collect(fetcher, ['a', 'b', 'c', 'd'])
+            opened = stats['connections']
+            await asyncio.sleep(0.5)
+            items = await asyncio.wait_for(
+                collect(fetcher, ['e', 'f', 'g', 'h']), 10)
+            assert len(items) == 8 and not fetcher.failed
+            assert stats['connections'] > opened
+
+        # the server sees the pooled connections close before shutting down
+        while stats['open']:
+            await asyncio.sleep(0.01)
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(self_check())
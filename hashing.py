@@ -0,0 +1,140 @@
+"""
+Feature hashing of stems and stem bigrams into a fixed width sparse space.
+No vocabulary is kept: a feature's column comes from a stable hash of its
+text, so shards vectorized in different processes or on different
+machines line up without sharing any state
+"""
+
+import hashlib
+import math
+
+import numpy as np
+from scipy import sparse
+
+
+def feature_hash(feature):
+    """ Unsigned 64 bit blake2b hash of a feature string """
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'),
+                                          digest_size=8).digest(), 'little')
+
+
+def iter_features(tokens, ngrams=2):
+    """ Stems, then space joined n-grams of up to ngrams consecutive stems """
+    tokens = list(tokens)
+    for n in range(1, ngrams + 1):
+        for i in range(len(tokens) - n + 1):
+            yield u' '.join(tokens[i:i + n]) if n > 1 else tokens[i]
+
+
+class HashingVectorizer(object):
+    """
+    Maps stemmed tokens, e.g. from ingest.iter_tokens or
+    IndonesianStemmer.stem_many, to 2 ** bits columns. The low bits of a
+    feature's hash pick its column and, with signed, the top bit its sign,
+    so collisions cancel out on average instead of adding up. Vectors are
+    L2 normalized when normalize is set, matching DocumentMatrix rows:
+
+        matrix = vectorizer.transform_many(documents)
+        posts = DocumentMatrix(doc_ids, None, matrix)
+        posts.query(vectorizer.transform(query_tokens))
+    """
+
+    def __init__(self, bits=20, ngrams=2, signed=True, normalize=True):
+        if not 1 <= bits <= 31:
+            raise ValueError("bits must be between 1 and 31")
+        self.bits = bits
+        self.ngrams = ngrams
+        self.signed = signed
+        self.normalize = normalize
+        self.width = 1 << bits
+        self._mask = self.width - 1
+
+    def _add(self, vector, tokens):
+        mask = self._mask
+        signed = self.signed
+        for feature in iter_features(tokens, self.ngrams):
+            h = feature_hash(feature)
+            column = h & mask
+            value = -1.0 if signed and h >> 63 else 1.0
+            vector[column] = vector.get(column, 0.0) + value
+
+    def transform(self, tokens):
+        """ {column: weight} of one document's stemmed tokens """
+        vector = {}
+        self._add(vector, tokens)
+        if self.normalize:
+            norm = math.sqrt(sum(w * w for w in vector.values()))
+            if norm:
+                for column in vector:
+                    vector[column] /= norm
+        return dict((column, weight) for column, weight in vector.items()
+                    if weight)
+
+    def transform_many(self, documents):
+        """
+        CSR len(documents) x 2 ** bits float32 matrix of an iterable of
+        token sequences, built in one pass. Matrices of independently
+        vectorized shards can be joined with scipy.sparse.vstack
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for tokens in documents:
+            vector = self.transform(tokens)
+            indices.extend(vector.keys())
+            data.extend(vector.values())
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32),
+             np.asarray(indices, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, self.width))
+
+
+if __name__ == "__main__":
+    import random
+
+    from similarity import DocumentMatrix
+
+    # stable across processes and runs, unlike hash()
+    assert feature_hash(u'makan') == 9864756819694223552
+    assert list(iter_features([u'a', u'b', u'c'])) == \
+        [u'a', u'b', u'c', u'a b', u'b c']
+    try:
+        HashingVectorizer(bits=32)
+        assert False, "bits out of range"
+    except ValueError:
+        pass
+
+    rnd = random.Random(0)
+    stems = [u'stem%d' % n for n in range(400)]
+    documents = [[rnd.choice(stems) for _ in range(rnd.randint(1, 30))]
+                 for _ in range(300)]
+    doc_ids = ['d%d' % n for n in range(len(documents))]
+
+    # the class docstring example
+    vectorizer = HashingVectorizer(bits=16)
+    matrix = vectorizer.transform_many(documents)
+    posts = DocumentMatrix(doc_ids, None, matrix)
+    for n in (0, 42, 299):
+        ranked = posts.query(vectorizer.transform(documents[n]), k=5)
+        assert ranked[0][0] == doc_ids[n] and abs(ranked[0][1] - 1.0) < 1e-5
+        assert all(score > 0 for _, score in ranked)
+    assert 'd42' not in dict(posts.similar('d42', k=3))
+
+    # rows are the normalized transform of their document
+    assert matrix.shape == (len(documents), 1 << 16)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    assert np.allclose(norms, 1.0, atol=1e-5)
+    row = matrix.getrow(7)
+    assert dict(zip(row.indices.tolist(), row.data.tolist())) == \
+        dict((column, np.float32(weight)) for column, weight in
+             vectorizer.transform(documents[7]).items())
+
+    # shards vectorized separately stack into the same matrix
+    shards = sparse.vstack([vectorizer.transform_many(documents[:120]),
+                            vectorizer.transform_many(documents[120:])],
+                           format='csr')
+    assert (shards != matrix).nnz == 0
+    assert vectorizer.transform([]) == {}
+    assert vectorizer.transform_many([]).shape == (0, 1 << 16)
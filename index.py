@@ -0,0 +1,171 @@
+"""
+Incremental TF-IDF index over stemmed documents
+"""
+
+import math
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from vocab import Vocabulary, term_counts
+
+
+class TfidfIndex(object):
+    """
+    Term frequencies per document and document frequencies per term, kept
+    up to date as documents are added and removed. IDF weights are derived
+    from the current counts when asked for, so no update ever touches more
+    than the terms of the document being added or removed.
+
+    Terms are ids of vocabulary: a document is stored as a pair of uint32
+    arrays (term ids, counts) and df is an array indexed by term id, so
+    weighting a document is a handful of vectorized operations.
+
+    idf(t) = log((1 + N) / (1 + df(t))) + 1
+    """
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None \
+            else Vocabulary()
+        self.docs = {}
+        self.df = np.zeros(1024, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.docs
+
+    def _grow(self, size):
+        if size > len(self.df):
+            df = np.zeros(max(size, 2 * len(self.df)), dtype=np.uint32)
+            df[:len(self.df)] = self.df
+            self.df = df
+
+    def add_document(self, doc_id, tokens):
+        """
+        Index doc_id, replacing an older version. tokens are stems, which
+        are interned, or an array('I') / uint32 array of term ids. Returns
+        the (term ids, counts) stored for the document
+        """
+        if doc_id in self.docs:
+            self.remove_document(doc_id)
+        if not isinstance(tokens, (array, np.ndarray)):
+            tokens = self.vocabulary.encode(tokens)
+        tf = term_counts(tokens)
+        self.docs[doc_id] = tf
+        self._grow(len(self.vocabulary))
+        self.df[tf[0]] += 1
+        return tf
+
+    def remove_document(self, doc_id):
+        """ Drop doc_id from the index. Returns its (term ids, counts) """
+        tf = self.docs.pop(doc_id)
+        self.df[tf[0]] -= 1
+        return tf
+
+    def tf(self, doc_id):
+        return self.docs[doc_id]
+
+    def idf(self, term_id):
+        df = self.df[term_id] if term_id < len(self.df) else 0
+        return math.log((1.0 + len(self.docs)) / (1.0 + df)) + 1.0
+
+    def idfs(self, term_ids):
+        """ idf of an array of term ids """
+        return np.log((1.0 + len(self.docs)) / (1.0 + self.df[term_ids])) \
+            + 1.0
+
+    def weights(self, term_ids, counts, normalize=True):
+        """ float64 TF-IDF weights of parallel term id and count arrays """
+        weights = counts * self.idfs(term_ids)
+        if normalize:
+            norm = np.sqrt(np.dot(weights, weights))
+            if norm:
+                weights /= norm
+        return weights
+
+    def weigh(self, tf, normalize=True):
+        """
+        TF-IDF weights {term id: weight} for a {term id: count} mapping,
+        e.g. a query or a document not in the index, optionally L2
+        normalized
+        """
+        term_ids = np.fromiter(tf.keys(), dtype=np.intp, count=len(tf))
+        counts = np.fromiter(tf.values(), dtype=np.float64, count=len(tf))
+        self._grow(len(self.vocabulary))
+        return dict(zip(term_ids.tolist(),
+                        self.weights(term_ids, counts, normalize).tolist()))
+
+    def query(self, tokens, normalize=True):
+        """ weigh() for stems; stems not in the vocabulary are ignored """
+        return self.weigh(Counter(self.vocabulary.lookup(tokens)), normalize)
+
+    def vector(self, doc_id, normalize=True):
+        """ TF-IDF weights {term id: weight} of an indexed document """
+        term_ids, counts = self.docs[doc_id]
+        return dict(zip(term_ids.tolist(),
+                        self.weights(term_ids, counts, normalize).tolist()))
+
+    def arrays(self, doc_id, normalize=True):
+        """ (term ids, weights) arrays of an indexed document """
+        term_ids, counts = self.docs[doc_id]
+        return term_ids, self.weights(term_ids, counts, normalize)
+
+    def terms(self):
+        """ Ids of the terms occurring in at least one indexed document """
+        return np.flatnonzero(self.df[:len(self.vocabulary)])
+
+
+if __name__ == "__main__":
+    import random
+
+    rnd = random.Random(0)
+    stems = [u'stem%d' % n for n in range(300)]
+
+    def document():
+        return [stems[int(rnd.paretovariate(1.1)) % len(stems)]
+                for _ in range(rnd.randint(1, 40))]
+
+    # incremental adds, replacements and removals leave the same weights
+    # as indexing the surviving documents from scratch
+    index = TfidfIndex()
+    documents = {}
+    for n in range(2000):
+        doc_id = 'd%d' % rnd.randrange(1500)
+        if doc_id in documents and rnd.random() < 0.3:
+            index.remove_document(doc_id)
+            del documents[doc_id]
+        else:
+            documents[doc_id] = document()
+            if rnd.random() < 0.5:
+                index.add_document(doc_id, documents[doc_id])
+            else:
+                index.add_document(doc_id,
+                                   index.vocabulary.encode(documents[doc_id]))
+
+    rebuilt = TfidfIndex()
+    for doc_id in sorted(documents):
+        rebuilt.add_document(doc_id, documents[doc_id])
+    assert len(index) == len(rebuilt) == len(documents)
+    assert set(index.vocabulary.decode(index.terms())) == \
+        set(rebuilt.vocabulary.decode(rebuilt.terms()))
+
+    def by_stem(tfidf, weights):
+        return tfidf.vocabulary.decode_weights(weights)
+
+    for doc_id in documents:
+        for normalize in (True, False):
+            expected = by_stem(rebuilt, rebuilt.vector(doc_id, normalize))
+            actual = by_stem(index, index.vector(doc_id, normalize))
+            assert set(actual) == set(expected)
+            for stem, weight in expected.items():
+                assert abs(actual[stem] - weight) < 1e-9
+    query = [stems[1], stems[2], stems[2], u'unknown']
+    expected = by_stem(rebuilt, rebuilt.query(query))
+    actual = by_stem(index, index.query(query))
+    assert set(actual) == set(expected) == set(stems[1:3])
+    assert all(abs(actual[stem] - expected[stem]) < 1e-9 for stem in expected)
+    assert abs(index.idf(len(index.vocabulary) + 10) -
+               (math.log(1.0 + len(index)) + 1.0)) < 1e-12
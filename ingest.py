@@ -0,0 +1,287 @@
+"""
+Streaming pipeline from activity items to stemmed tokens:
+HTML stripping, entity decoding, lowercasing, punctuation and
+reduplication handling, stop word removal and stemming, one token at a time
+"""
+
+import hashlib
+import re
+import sqlite3
+from html.parser import HTMLParser
+
+from stem import IndonesianStemmer, STOP_WORDS
+
+
+# letters and digits, with hyphens inside a word (tiba-tiba, e-mail)
+_WORD = re.compile(r'[^\W_]+(?:-[^\W_]+)*')
+
+# tags that separate words even without surrounding whitespace
+_BREAK_TAGS = frozenset(['br', 'p', 'div', 'li', 'ul', 'ol', 'tr', 'td',
+                         'th', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                         'blockquote', 'pre', 'hr', 'img'])
+_SKIP_TAGS = frozenset(['script', 'style'])
+
+_default_stemmer = None
+
+
+def _get_stemmer(stemmer):
+    global _default_stemmer
+    if stemmer is not None:
+        return stemmer
+    if _default_stemmer is None:
+        _default_stemmer = IndonesianStemmer(cache_size=10000)
+    return _default_stemmer
+
+
+class TextExtractor(HTMLParser):
+    """
+    HTMLParser that queues text fragments as they are parsed instead of
+    collecting the whole document. Entities are decoded by the parser
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.fragments = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BREAK_TAGS:
+            self.fragments.append(u' ')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BREAK_TAGS:
+            self.fragments.append(u' ')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif tag in _BREAK_TAGS:
+            self.fragments.append(u' ')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.fragments.append(data)
+
+    def drain(self):
+        fragments = self.fragments
+        self.fragments = []
+        return fragments
+
+
+def iter_text(html, chunk_size=4096):
+    """ Yield the text fragments of html, feeding the parser chunk by chunk """
+    parser = TextExtractor()
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        for fragment in parser.drain():
+            yield fragment
+    parser.close()
+    for fragment in parser.drain():
+        yield fragment
+
+
+def strip_tags(html):
+    """ Plain text of html, like the notebook's MLStripper """
+    return u''.join(iter_text(html))
+
+
+def iter_words(fragments):
+    """
+    Yield the lowercased words of a stream of text fragments, dropping
+    punctuation. A word cut between two fragments is joined back together
+    """
+    carry = u''
+    for fragment in fragments:
+        text = carry + fragment.lower()
+        carry = u''
+        for match in _WORD.finditer(text):
+            if text[match.end():] in (u'', u'-'):
+                carry = text[match.start():]
+                break
+            yield match.group()
+    for match in _WORD.finditer(carry):
+        yield match.group()
+
+
+def collapse_reduplication(word):
+    """
+    Reduce reduplicated words to their base: tiba-tiba -> tiba,
+    bersama-sama -> bersama. Other hyphenated words are returned unchanged
+    """
+    head, sep, tail = word.partition(u'-')
+    if sep and tail and u'-' not in tail and head.endswith(tail):
+        return head
+    return word
+
+
+def iter_tokens(html, stemmer=None, stop_words=True):
+    """
+    Yield the stemmed tokens of an HTML post body. Stop words are matched
+    on the surface form, before reduplication is collapsed
+    """
+    stemmer = _get_stemmer(stemmer)
+    for word in iter_words(iter_text(html)):
+        if stop_words and word in STOP_WORDS:
+            continue
+        yield stemmer.stem(collapse_reduplication(word))
+
+
+def item_content(item):
+    """ The HTML body of an activity item, or None if it has none """
+    obj = item.get('object')
+    if not obj:
+        return None
+    return obj.get('content')
+
+
+def content_digest(content):
+    """ sha1 hex digest of a raw post body """
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class ContentCache(object):
+    """
+    Stemmed token streams keyed by the digest of the raw post body, kept in
+    SQLite so they survive between runs. At most max_entries are kept; the
+    least recently used are evicted in batches. Writes are committed every
+    commit_every operations and on close
+    """
+
+    def __init__(self, path=':memory:', max_entries=100000, commit_every=1000):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS tokens ("
+                        "digest TEXT PRIMARY KEY, tokens TEXT NOT NULL, "
+                        "used INTEGER NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tokens_used "
+                        "ON tokens (used)")
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._size, self._clock = self.db.execute(
+            "SELECT COUNT(*), COALESCE(MAX(used), 0) FROM tokens").fetchone()
+
+    def __len__(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _tick(self):
+        self._clock += 1
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.db.commit()
+            self._pending = 0
+        return self._clock
+
+    def get(self, digest):
+        """ Cached tokens of a body digest, or None """
+        row = self.db.execute("SELECT tokens FROM tokens WHERE digest = ?",
+                              (digest,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE tokens SET used = ? WHERE digest = ?",
+                        (self._tick(), digest))
+        return row[0].split(u' ') if row[0] else []
+
+    def put(self, digest, tokens):
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO tokens (digest, tokens, used) "
+            "VALUES (?, ?, ?)", (digest, u' '.join(tokens), self._tick()))
+        self._size += cursor.rowcount
+        if self._size > self.max_entries:
+            # evict down to 90% so eviction does not run on every insert
+            excess = self._size - int(self.max_entries * 0.9)
+            self.db.execute("DELETE FROM tokens WHERE digest IN ("
+                            "SELECT digest FROM tokens ORDER BY used LIMIT ?)",
+                            (excess,))
+            self._size -= excess
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def iter_item_tokens(items, stemmer=None, stop_words=True, cache=None):
+    """
+    Yield (item, tokens) for every activity item with a body, tokens being
+    a lazy iterator of its stemmed tokens. Items without object.content are
+    skipped. With a ContentCache, bodies seen before (reshares, cross
+    posts) reuse their cached tokens instead of being stripped and stemmed
+    again
+    """
+    stemmer = _get_stemmer(stemmer)
+    for item in items:
+        content = item_content(item)
+        if not content:
+            continue
+        if cache is None:
+            yield item, iter_tokens(content, stemmer, stop_words)
+            continue
+        # the same body gives different tokens with and without stop words
+        digest = u'%d:%s' % (bool(stop_words), content_digest(content))
+        tokens = cache.get(digest)
+        if tokens is None:
+            tokens = list(iter_tokens(content, stemmer, stop_words))
+            cache.put(digest, tokens)
+        yield item, iter(tokens)
+
+
+def parse_out_text(html, stemmer=None):
+    """ Space separated stems of an HTML body, like the notebook's parseOutText """
+    return u' '.join(iter_tokens(html, stemmer, stop_words=False))
+
+
+if __name__ == "__main__":
+    import os
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'tokens.sqlite')
+        with ContentCache(path, max_entries=10, commit_every=3) as cache:
+            for n in range(10):
+                cache.put('d%d' % n, [u'kata', str(n)])
+            assert len(cache) == 10
+            # d0 and d1 are used again, so d2 and d3 are the oldest
+            assert cache.get('d0') == [u'kata', u'0']
+            assert cache.get('d1') == [u'kata', u'1']
+            cache.put('d10', [])
+            assert len(cache) == 9
+            assert cache.get('d2') is None and cache.get('d3') is None
+            assert cache.get('d10') == []
+            assert (cache.hits, cache.misses) == (3, 2)
+
+        # entries and their recency survive a restart
+        with ContentCache(path, max_entries=10) as cache:
+            assert len(cache) == 9
+            assert cache.get('d0') == [u'kata', u'0']
+            cache.put('d11', [u'a'])
+            cache.put('d12', [u'b'])
+            assert len(cache) == 9
+            assert cache.get('d4') is None and cache.get('d5') is None
+            assert cache.get('d1') == [u'kata', u'1']
+
+        # reshared bodies are stemmed once, with and without stop words
+        body = u'<p>Saya sedang makan makanan</p>'
+        items = [{'id': str(n), 'object': {'content': body}}
+                 for n in range(3)] + [{'id': 'photo', 'object': {}}]
+        with ContentCache() as cache:
+            tokens = [list(t) for _, t in iter_item_tokens(items, cache=cache)]
+            assert len(tokens) == 3 and tokens[0] == tokens[1] == tokens[2]
+            assert (cache.hits, cache.misses) == (2, 1)
+            assert [list(t) for _, t in iter_item_tokens(
+                items[:1], stop_words=False, cache=cache)] != tokens[:1]
+            assert len(cache) == 2
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,171 @@
+"""
+Precomputed word -> stem lexicon stored as a memory mapped open addressing
+hash table, so stemmer processes share one page cache backed dictionary and
+a lookup costs about one probe instead of a binary search
+
+File layout, all integers little endian:
+
+    magic (8 bytes) | count (uint32) | slot count (uint32, power of two)
+    slots    slot count * (crc32 of key, record offset, key length,
+                           value length)                (4 x uint32)
+    records  key | value
+
+Keys and values are utf-8. A key lives in slot crc32(key) & (slots - 1) or
+the first free slot after it (linear probing); empty slots have offset
+EMPTY. The table is kept at most half full so misses stop quickly.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+
+from stem import IndonesianStemmer
+
+
+MAGIC = b'IDSTEML2'
+EMPTY = 0xFFFFFFFF
+_HEADER = struct.Struct('<8sII')
+_SLOT = struct.Struct('<IIII')
+_unpack_slot = _SLOT.unpack_from
+
+
+def _slot_count(count):
+    slots = 8
+    while slots < 2 * count:
+        slots *= 2
+    return slots
+
+
+def build_lexicon(words, path, stemmer=None):
+    """
+    Stem every distinct word of words and write the lexicon to path. The
+    file is written next to path and renamed into place, so readers never
+    see a partial lexicon
+    """
+    if stemmer is None:
+        stemmer = IndonesianStemmer()
+
+    words = sorted(set(words))
+    num_slots = _slot_count(len(words))
+    mask = num_slots - 1
+    slots = [(0, EMPTY, 0, 0)] * num_slots
+
+    records = []
+    offset = _HEADER.size + num_slots * _SLOT.size
+    for word in words:
+        key = word.encode('utf-8')
+        value = stemmer.stem(word).encode('utf-8')
+        crc = zlib.crc32(key)
+        i = crc & mask
+        while slots[i][1] != EMPTY:
+            i = (i + 1) & mask
+        slots[i] = (crc, offset, len(key), len(value))
+        records.append(key + value)
+        offset += len(key) + len(value)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(words), num_slots))
+        f.write(b''.join(_SLOT.pack(*slot) for slot in slots))
+        f.write(b''.join(records))
+    os.replace(tmp_path, path)
+    return len(words)
+
+
+class StemLexicon(object):
+    """
+    Read only, memory mapped view of a lexicon written by build_lexicon.
+    Lookups hash the word and probe the slot table directly in the mapping
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, num_slots = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError("%s is not a stem lexicon" % path)
+        self._mask = num_slots - 1
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, word, default=None):
+        """ Return the stem of word, or default when it is not in the lexicon """
+        key = word.encode('utf-8')
+        crc = zlib.crc32(key)
+        data = self._map
+        mask = self._mask
+        i = crc & mask
+        while True:
+            slot_crc, offset, key_len, value_len = \
+                _unpack_slot(data, _HEADER.size + i * _SLOT.size)
+            if offset == EMPTY:
+                return default
+            if slot_crc == crc:
+                end = offset + key_len
+                if data[offset:end] == key:
+                    return data[end:end + value_len].decode('utf-8')
+            i = (i + 1) & mask
+
+    def close(self):
+        self._map.close()
+
+
+if __name__ == "__main__":
+    import random
+    import shutil
+    import tempfile
+
+    from stem import stem_word
+
+    rnd = random.Random(0)
+    syllables = [u'ba', u'ka', u'ma', u'la', u'ta', u'ri', u'nu', u'si',
+                 u'go', u'pe', u'ja', u'an']
+    affixes = [(u'', u''), (u'me', u'kan'), (u'di', u'i'), (u'ber', u''),
+               (u'pe', u'an'), (u'ter', u'lah'), (u'ke', u'an'), (u'', u'nya')]
+    words = set()
+    while len(words) < 50000:
+        root = u''.join(rnd.choice(syllables) for _ in range(rnd.randint(2, 4)))
+        prefix, suffix = rnd.choice(affixes)
+        words.add(prefix + root + suffix)
+    words = sorted(words)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'stems.lex')
+        assert build_lexicon(words, path) == len(words)
+        with StemLexicon(path) as lexicon:
+            assert len(lexicon) == len(words)
+            for word in words:
+                assert lexicon.get(word) == stem_word(word)
+            assert lexicon.get(u'tidakadadisini') is None
+            assert u'tidakadadisini' not in lexicon
+            assert words[0] in lexicon
+
+            # words of any length, such as a run-on token from one post
+            long_word = u'ke' + u'panjang' * 10000 + u'an'
+            long_path = os.path.join(tmp, 'long.lex')
+            assert build_lexicon([long_word, u'makanan'], long_path) == 2
+            with StemLexicon(long_path) as long_lexicon:
+                assert long_lexicon.get(long_word) == stem_word(long_word)
+                assert long_lexicon.get(u'makanan') == u'makan'
+
+            # lexicon hits are put into the cache, so repeats skip the lookup
+            stemmer = IndonesianStemmer(cache_size=4, lexicon=lexicon)
+            assert stemmer.stem(words[1]) == stem_word(words[1])
+            assert words[1] in stemmer.cache
+            assert stemmer.stem(words[1]) == stem_word(words[1])
+            assert stemmer.cache_info()['hits'] == 1
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,306 @@
+"""
+Two stage recommendation: cheap candidate generators feed one merged
+candidate set, and a more expensive reranker scores only that set. Every
+stage has a time budget and a candidate cap and degrades to whatever it
+managed to produce when it runs out of time or fails. Budgets are checked
+between the candidates a generator yields. One that computes its whole
+list before returning (index, duplicate and popularity generators below)
+is only cut short when the pipeline has an executor to run it on;
+otherwise it finishes, its list is merged and it is recorded as
+incomplete when it overran
+"""
+
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dedup import estimate_jaccard
+
+
+class Generator(object):
+    """
+    A candidate source. func(user_id, cap) returns or yields (item_id,
+    score) best first; consumption stops after cap candidates or once
+    budget seconds have passed. A returned list or tuple, whose work is
+    already done, is merged up to the cap however long it took. Merged
+    scores are weight * score summed over the generators that
+    proposed an item
+    """
+
+    def __init__(self, name, func, cap=100, budget=0.005, weight=1.0):
+        self.name = name
+        self.func = func
+        self.cap = cap
+        self.budget = budget
+        self.weight = weight
+
+
+class Recommendations(list):
+    """
+    Ranked [(item_id, score)]. stats maps each stage name to
+    (candidates, seconds, complete, error), error being the exception that
+    ended the stage or None, and sources maps an item to the generators
+    that proposed it
+    """
+
+    def __init__(self, ranked=(), stats=None, sources=None):
+        list.__init__(self, ranked)
+        self.stats = stats or {}
+        self.sources = sources or {}
+
+
+class Pipeline(object):
+    """
+    reranker(user_id, item_ids) returns one score per item and is called
+    on batches of rerank_batch candidates, best merged candidates first,
+    until rerank_budget runs out; candidates it did not reach are ranked
+    after the reranked ones by merged score. budget bounds the whole
+    request: generators that would start after it has passed are skipped.
+    exclude(user_id, item_id) drops candidates, e.g. posts already shown.
+    With an executor, generator functions run on it and one that has not
+    returned within its budget is abandoned with no candidates
+    """
+
+    def __init__(self, generators, reranker=None, rerank_cap=200,
+                 rerank_budget=0.02, rerank_batch=32, budget=None,
+                 exclude=None, executor=None, clock=time.perf_counter):
+        self.generators = list(generators)
+        self.reranker = reranker
+        self.rerank_cap = rerank_cap
+        self.rerank_budget = rerank_budget
+        self.rerank_batch = rerank_batch
+        self.budget = budget
+        self.exclude = exclude
+        self.executor = executor
+        self.clock = clock
+
+    def _call(self, generator, user_id, stop):
+        """ generator.func(user_id, cap), or None when it ran out of time """
+        if self.executor is None:
+            return generator.func(user_id, generator.cap)
+        future = self.executor.submit(generator.func, user_id, generator.cap)
+        try:
+            return future.result(max(0.0, stop - self.clock()))
+        except FutureTimeoutError:
+            future.cancel()
+            return None
+
+    def candidates(self, user_id, stats, sources, deadline=None):
+        """ Merged {item_id: score} of all generators within their budgets """
+        merged = {}
+        for generator in self.generators:
+            started = self.clock()
+            if deadline is not None and started >= deadline:
+                stats[generator.name] = (0, 0.0, False, None)
+                continue
+            stop = started + generator.budget
+            if deadline is not None:
+                stop = min(stop, deadline)
+
+            count = 0
+            complete = True
+            error = None
+            try:
+                produced = self._call(generator, user_id, stop)
+                if produced is None:
+                    complete = False
+                    produced = ()
+                lazy = not isinstance(produced, (list, tuple))
+                for item_id, score in produced:
+                    if self.exclude is None or \
+                       not self.exclude(user_id, item_id):
+                        merged[item_id] = merged.get(item_id, 0.0) + \
+                            generator.weight * score
+                        sources.setdefault(item_id, []).append(
+                            generator.name)
+                        count += 1
+                        if count >= generator.cap:
+                            break
+                    if lazy and self.clock() >= stop:
+                        complete = False
+                        break
+            except Exception as e:
+                # keep what was merged so far, the other generators still run
+                complete = False
+                error = e
+            finished = self.clock()
+            if finished > stop:
+                # an eager generator run inline cannot be interrupted
+                complete = False
+            stats[generator.name] = (count, finished - started, complete,
+                                     error)
+        return merged
+
+    def rerank(self, user_id, ranked, stats, deadline=None):
+        """ Rerank the best rerank_cap of ranked [(item_id, score)] """
+        started = self.clock()
+        stop = started + self.rerank_budget
+        if deadline is not None:
+            stop = min(stop, deadline)
+
+        head = ranked[:self.rerank_cap]
+        reranked = []
+        done = 0
+        error = None
+        try:
+            while done < len(head) and self.clock() < stop:
+                batch = [item_id for item_id, _ in
+                         head[done:done + self.rerank_batch]]
+                scores = list(self.reranker(user_id, batch))
+                if len(scores) != len(batch):
+                    raise ValueError("reranker returned %d scores for %d "
+                                     "items" % (len(scores), len(batch)))
+                reranked.extend(zip(batch, scores))
+                done += len(batch)
+        except Exception as e:
+            error = e
+        reranked.sort(key=lambda entry: -entry[1])
+        stats['rerank'] = (done, self.clock() - started, done == len(head),
+                           error)
+        return reranked + ranked[done:]
+
+    def recommend(self, user_id, k=10):
+        started = self.clock()
+        deadline = started + self.budget if self.budget is not None else None
+        stats = {}
+        sources = {}
+        merged = self.candidates(user_id, stats, sources, deadline)
+        ranked = sorted(merged.items(), key=lambda entry: -entry[1])
+        if self.reranker is not None and ranked:
+            ranked = self.rerank(user_id, ranked, stats, deadline)
+        stats['total'] = (len(merged), self.clock() - started, True, None)
+        return Recommendations(ranked[:k], stats, sources)
+
+
+def index_generator(inverted, profiles, name='stems', **options):
+    """ Posts sharing stems with the user's profile, via the inverted index """
+    def func(user_id, cap):
+        return inverted.top_k(profiles.vector(user_id), cap)
+    return Generator(name, func, **options)
+
+
+def duplicate_generator(detector, recent_posts, name='duplicates',
+                        **options):
+    """
+    Near duplicate neighbours, from the LSH index, of the posts
+    recent_posts(user_id) returns, scored by estimated Jaccard similarity
+    """
+    def func(user_id, cap):
+        signatures = detector.lsh.signatures
+        seeds = [detector.canonical.get(post, post)
+                 for post in recent_posts(user_id)]
+        found = {}
+        for seed in seeds:
+            signature = signatures.get(seed)
+            if signature is None:
+                continue
+            for other in detector.lsh.candidates(signature):
+                if other != seed:
+                    similarity = estimate_jaccard(signature, signatures[other])
+                    found[other] = max(found.get(other, 0.0), similarity)
+        return sorted(found.items(), key=lambda entry: -entry[1])[:cap]
+    return Generator(name, func, **options)
+
+
+def graph_generator(graph, posts_of, name='graph', people=20, **options):
+    """
+    Posts, from posts_of(user_id), of the people the circle graph suggests
+    for the user, scored by that person's rank
+    """
+    def func(user_id, cap):
+        for other, rank in graph.suggest(user_id, people):
+            for post in posts_of(other):
+                yield post, rank
+    return Generator(name, func, **options)
+
+
+def popularity_generator(counts, name='popular', **options):
+    """
+    Most interacted with posts from a Counter, scored relative to the most
+    popular one. Ranked once per call from the live counts
+    """
+    def func(user_id, cap):
+        top = counts.most_common(cap)
+        if not top:
+            return []
+        best = float(top[0][1])
+        return [(item_id, count / best) for item_id, count in top]
+    return Generator(name, func, **options)
+
+
+if __name__ == "__main__":
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+
+    now = [0.0]
+
+    def clock():
+        return now[0]
+
+    def eager(user_id, cap):
+        now[0] += 0.05
+        return [('a', 1.0), ('b', 0.5)]
+
+    def lazy(user_id, cap):
+        for n in range(10):
+            now[0] += 0.002
+            yield 'l%d' % n, 0.1
+
+    def broken(user_id, cap):
+        yield 'c', 0.7
+        raise RuntimeError("generator failed")
+
+    # an eager generator that overran still contributes its whole list, a
+    # lazy one is cut at its budget and a failing one keeps what it yielded
+    pipeline = Pipeline([Generator('eager', eager), Generator('lazy', lazy),
+                         Generator('broken', broken),
+                         Generator('popular', popularity_generator(
+                             Counter({'b': 4, 'd': 2})).func)],
+                        exclude=lambda user_id, item_id: item_id == 'l0',
+                        clock=clock)
+    result = pipeline.recommend('u', k=20)
+    assert result.stats['eager'][:3] == (2, 0.05, False)
+    assert result.stats['lazy'][0] == 2 and not result.stats['lazy'][2]
+    assert isinstance(result.stats['broken'][3], RuntimeError)
+    assert result.stats['popular'] == (2, 0.0, True, None)
+    assert [item_id for item_id, _ in result] == \
+        ['b', 'a', 'c', 'd', 'l1', 'l2']
+    assert result.sources['b'] == ['eager', 'popular']
+
+    # a request budget skips the generators that would start after it
+    pipeline.budget = 0.05
+    result = pipeline.recommend('u')
+    assert [item_id for item_id, _ in result] == ['a', 'b']
+    assert result.stats['lazy'] == result.stats['broken'] == \
+        (0, 0.0, False, None)
+
+    # reranked candidates come first; a reranker returning too few scores
+    # stops reranking and the rest keep their merged order
+    def rerank(user_id, item_ids):
+        return [1.0 if item_id == 'd' else 0.0 for item_id in item_ids]
+
+    pipeline = Pipeline([Generator('popular', popularity_generator(
+        Counter({'a': 5, 'b': 4, 'c': 3, 'd': 2})).func)],
+        reranker=rerank, rerank_batch=2, clock=clock)
+    assert [item_id for item_id, _ in pipeline.recommend('u')] == \
+        ['d', 'a', 'b', 'c']
+    pipeline.reranker = lambda user_id, item_ids: [1.0]
+    result = pipeline.recommend('u')
+    assert [item_id for item_id, _ in result] == ['a', 'b', 'c', 'd']
+    assert isinstance(result.stats['rerank'][3], ValueError)
+
+    # on an executor an eager generator past its budget is abandoned
+    def slow(user_id, cap):
+        time.sleep(0.2)
+        return [('slow', 1.0)]
+
+    with ThreadPoolExecutor(2) as executor:
+        pipeline = Pipeline([Generator('slow', slow, budget=0.02),
+                             Generator('eager', lambda u, cap: [('a', 1.0)],
+                                       budget=0.05)],
+                            executor=executor)
+        started = time.perf_counter()
+        result = pipeline.recommend('u')
+        assert time.perf_counter() - started < 0.15
+        assert result == [('a', 1.0)]
+        assert result.stats['slow'][0] == 0 and not result.stats['slow'][2]
+        assert result.stats['eager'][2]
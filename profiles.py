@@ -0,0 +1,185 @@
+"""
+Per user interest profiles: exponentially time decayed centroids of the
+TF-IDF vectors of the user's posts, updated per post with lazy decay
+"""
+
+import math
+from datetime import datetime
+
+
+def parse_time(value):
+    """ Seconds since the epoch of an RFC 3339 time from the activity feed """
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+class UserProfile(object):
+    """
+    Decayed sum of post vectors and of post counts. Both are stored divided
+    by scale, the decay accumulated since they were last rescaled, so
+    moving the profile forward in time only multiplies scale and adding a
+    post touches nothing but the post's own terms. The centroid is
+    weights / mass, where scale cancels out
+    """
+
+    __slots__ = ('weights', 'mass', 'scale', 'updated')
+
+    # rescale before 1 / scale can lose precision or overflow
+    MIN_SCALE = 1e-100
+
+    def __init__(self, updated=None):
+        self.weights = {}
+        self.mass = 0.0
+        self.scale = 1.0
+        self.updated = updated
+
+    def decay_to(self, timestamp, half_life):
+        """ Move the profile forward to timestamp, O(1) """
+        if self.updated is None:
+            self.updated = timestamp
+        elif timestamp > self.updated:
+            self.scale *= 0.5 ** ((timestamp - self.updated) / half_life)
+            self.updated = timestamp
+            if self.scale < self.MIN_SCALE:
+                self.rescale()
+
+    def add(self, vector, timestamp, half_life):
+        """ Add a post vector published at timestamp, O(post terms) """
+        self.decay_to(timestamp, half_life)
+        # posts older than the profile enter already decayed
+        factor = 0.5 ** ((self.updated - timestamp) / half_life) / self.scale
+        weights = self.weights
+        for term, weight in vector.items():
+            weights[term] = weights.get(term, 0.0) + weight * factor
+        self.mass += factor
+
+    def rescale(self, min_weight=0.0):
+        """
+        Fold scale into the stored values, dropping terms whose centroid
+        weight is at most min_weight. O(profile terms), so only done when
+        scale gets small
+        """
+        scale = self.scale
+        mass = self.mass * scale
+        weights = {}
+        for term, weight in self.weights.items():
+            # filter on the scaled weight: one that underflowed to 0.0 is
+            # gone, whatever its ratio to mass was before scaling
+            weight *= scale
+            if weight and mass and weight / mass > min_weight:
+                weights[term] = weight
+        self.weights = weights
+        self.mass = mass
+        self.scale = 1.0
+
+    def centroid(self, normalize=True):
+        """ {term id: weight} centroid, optionally L2 normalized """
+        if not self.mass:
+            return {}
+        if normalize:
+            norm = math.sqrt(sum(w * w for w in self.weights.values()))
+        else:
+            norm = self.mass
+        return dict((term, weight / norm) for term, weight in
+                    self.weights.items())
+
+    def strength(self, timestamp, half_life):
+        """ Decayed number of posts behind the profile as of timestamp """
+        if self.updated is None:
+            return 0.0
+        age = max(timestamp - self.updated, 0)
+        return self.mass * self.scale * 0.5 ** (age / half_life)
+
+
+class ProfileStore(object):
+    """
+    Profiles of every user id passed to the activity endpoint. half_life
+    is in the unit of the timestamps, seconds by default: a post's weight
+    halves every half_life
+    """
+
+    def __init__(self, half_life=30 * 24 * 3600.0):
+        self.half_life = float(half_life)
+        self.profiles = {}
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def __contains__(self, user_id):
+        return user_id in self.profiles
+
+    def add_post(self, user_id, vector, timestamp):
+        """ Fold a post's {term id: weight} vector into the user's profile """
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = self.profiles[user_id] = UserProfile()
+        profile.add(vector, timestamp, self.half_life)
+        return profile
+
+    def vector(self, user_id, normalize=True):
+        """ The user's centroid, {} for unknown users """
+        profile = self.profiles.get(user_id)
+        return profile.centroid(normalize) if profile is not None else {}
+
+    def remove(self, user_id):
+        self.profiles.pop(user_id, None)
+
+
+if __name__ == "__main__":
+    import random
+
+    def eager_centroid(posts, timestamp, half_life):
+        """ The centroid recomputed from scratch, decaying every post """
+        weights = {}
+        for vector, published in posts:
+            factor = 0.5 ** ((timestamp - published) / half_life)
+            for term, weight in vector.items():
+                weights[term] = weights.get(term, 0.0) + weight * factor
+        weights = dict((term, weight) for term, weight in weights.items()
+                       if weight)
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return dict((term, weight / norm) for term, weight in weights.items())
+
+    def assert_close(centroid, expected):
+        assert set(centroid) == set(expected)
+        for term, weight in expected.items():
+            assert abs(centroid[term] - weight) < 1e-9
+
+    # lazy decay matches eager recomputation, across the rescales a short
+    # half life forces and with posts arriving out of order
+    rnd = random.Random(0)
+    store = ProfileStore(half_life=10.0)
+    posts = {}
+    timestamp = 0.0
+    for _ in range(3000):
+        user_id = rnd.choice('abc')
+        timestamp += rnd.expovariate(0.5)
+        published = timestamp - rnd.choice([0.0, 0.0, rnd.uniform(0, 30)])
+        vector = dict((rnd.randrange(50), rnd.random())
+                      for _ in range(rnd.randint(1, 5)))
+        store.add_post(user_id, vector, published)
+        posts.setdefault(user_id, []).append((vector, published))
+    for user_id, user_posts in posts.items():
+        profile = store.profiles[user_id]
+        assert_close(store.vector(user_id),
+                     eager_centroid(user_posts, profile.updated, 10.0))
+        assert abs(profile.strength(timestamp, 10.0) -
+                   sum(0.5 ** ((timestamp - published) / 10.0)
+                       for _, published in user_posts)) < 1e-9
+
+    # a gap long enough for scale to underflow leaves no zero weight terms
+    profile = UserProfile()
+    profile.add({1: 1.0, 2: 0.5}, 0.0, 1.0)
+    profile.decay_to(5000.0, 1.0)
+    assert profile.weights == {} and profile.mass == 0.0
+    assert profile.centroid() == {}
+    profile.add({3: 2.0}, 5000.0, 1.0)
+    assert profile.centroid() == {3: 1.0}
+
+    # rescale drops terms at or below min_weight of the centroid
+    profile = UserProfile()
+    profile.add({1: 1.0, 2: 0.2}, 0.0, 1.0)
+    profile.decay_to(3.0, 1.0)
+    profile.rescale(min_weight=0.5)
+    assert list(profile.weights) == [1] and profile.scale == 1.0
+    assert abs(profile.mass - 0.125) < 1e-12
+    assert ProfileStore().vector('nobody') == {}
@@ -0,0 +1,225 @@
+"""
+Inverted index from stem id to posting list with per term score upper
+bounds, and top-k retrieval with MaxScore dynamic pruning
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left
+from functools import partial
+
+
+# Upper bounds are inflated by this factor so floating point rounding in a
+# sum of contributions can never push a real score above its bound
+BOUND_SLACK = 1.0 + 1e-9
+
+# Head of an exhausted posting list, after every document number
+END = float('inf')
+
+
+def maxscore_top_k(lists, k, heap=None, skip=None):
+    """
+    MaxScore over posting lists given as (bound, order, query weight,
+    docs, weights) tuples, docs increasing. Query terms are ordered by
+    score upper bound; once the bounds of the lowest terms add up to no
+    more than the k-th best score so far, those terms are non-essential:
+    only documents from the remaining lists are visited, and the
+    non-essential lists are probed by binary search only while the document
+    can still make the top k. docs with a seek(doc, lo) method are probed
+    through it instead of bisect. Returns a heap of (score, -doc)
+
+    heap continues from the result of an earlier call over documents
+    numbered below these, and documents in skip are never scored
+    """
+    lists = sorted(lists)
+    count = len(lists)
+    seekers = [getattr(entry[3], 'seek', None) or partial(bisect_left, entry[3])
+               for entry in lists]
+    # bounds[i]: upper bound of the summed scores of lists[0..i]
+    bounds = []
+    reach = 0.0
+    for entry in lists:
+        reach += entry[0]
+        bounds.append(reach)
+    positions = [0] * count
+    lengths = [len(entry[3]) for entry in lists]
+    # heads[i]: document at positions[i] of an essential list, END when done
+    heads = [entry[3][0] if entry[3] else END for entry in lists]
+
+    if heap is None:
+        heap = []
+    threshold = heap[0][0] if heap and len(heap) >= k else 0.0
+    essential = 0
+    while essential < count and bounds[essential] <= threshold:
+        essential += 1
+    while essential < count:
+        doc = min(heads[essential:])
+        if doc == END:
+            break
+
+        contributions = []
+        score = 0.0
+        for i in range(essential, count):
+            if heads[i] == doc:
+                _, order, query_weight, docs, doc_weights = lists[i]
+                position = positions[i]
+                contribution = query_weight * doc_weights[position]
+                contributions.append((order, contribution))
+                score += contribution
+                position += 1
+                positions[i] = position
+                heads[i] = docs[position] if position < lengths[i] else END
+        if skip is not None and doc in skip:
+            continue
+
+        pruned = False
+        for i in range(essential - 1, -1, -1):
+            if score + bounds[i] <= threshold:
+                pruned = True
+                break
+            _, order, query_weight, docs, doc_weights = lists[i]
+            position = seekers[i](doc, positions[i])
+            positions[i] = position
+            if position < lengths[i] and docs[position] == doc:
+                contribution = query_weight * doc_weights[position]
+                contributions.append((order, contribution))
+                score += contribution
+        if pruned:
+            continue
+
+        # sum in query term order, as exhaustive_top_k does
+        contributions.sort()
+        score = 0.0
+        for _, contribution in contributions:
+            score += contribution
+        if score <= 0:
+            continue
+        if len(heap) < k:
+            heapq.heappush(heap, (score, -doc))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, -doc))
+        else:
+            continue
+        if len(heap) == k:
+            threshold = heap[0][0]
+            while essential < count and bounds[essential] <= threshold:
+                essential += 1
+    return heap
+
+
+class InvertedIndex(object):
+    """
+    Postings of every stem id: increasing document numbers (array('I'))
+    and the matching weights (array('d')), at postings[term id] or None.
+    Documents get consecutive numbers in the order they are added; doc_ids
+    maps them back. Scores are dot products of a {term id: weight} query
+    with the document weights
+    """
+
+    def __init__(self):
+        self.doc_ids = []
+        self.postings = []
+        self.max_weights = []
+
+    @classmethod
+    def from_index(cls, index):
+        """ Build from the normalized TF-IDF vectors of a TfidfIndex """
+        inverted = cls()
+        for doc_id in index.docs:
+            inverted.add_document(doc_id, index.vector(doc_id))
+        return inverted
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add_document(self, doc_id, weights):
+        """
+        Append a document given its {term id: weight} vector. Only
+        positive weights are indexed, which keeps the upper bounds valid
+        """
+        doc = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        postings = self.postings
+        for term_id, weight in weights.items():
+            if weight <= 0:
+                continue
+            if term_id >= len(postings):
+                grow = term_id + 1 - len(postings)
+                postings.extend([None] * grow)
+                self.max_weights.extend([0.0] * grow)
+            if postings[term_id] is None:
+                postings[term_id] = (array('I'), array('d'))
+            docs, doc_weights = postings[term_id]
+            docs.append(doc)
+            doc_weights.append(weight)
+            if weight > self.max_weights[term_id]:
+                self.max_weights[term_id] = weight
+        return doc
+
+    def _query_terms(self, weights):
+        """ (term_id, query weight) of the known positive query terms, by id """
+        terms = []
+        postings = self.postings
+        for term_id, weight in weights.items():
+            if weight > 0 and term_id < len(postings) and \
+                    postings[term_id] is not None:
+                terms.append((term_id, weight))
+        terms.sort()
+        return terms
+
+    def _result(self, heap):
+        return [(self.doc_ids[doc], score) for score, doc in
+                sorted(((score, -neg_doc) for score, neg_doc in heap),
+                       key=lambda entry: (-entry[0], entry[1]))]
+
+    def exhaustive_top_k(self, weights, k=10):
+        """
+        Score every document sharing a term with the query. Reference for
+        top_k; ties are broken by the order documents were added
+        """
+        scores = {}
+        for term_id, query_weight in self._query_terms(weights):
+            docs, doc_weights = self.postings[term_id]
+            for doc, weight in zip(docs, doc_weights):
+                scores[doc] = scores.get(doc, 0.0) + query_weight * weight
+        heap = [(score, -doc) for doc, score in scores.items() if score > 0]
+        return self._result(heapq.nlargest(k, heap))
+
+    def _posting_lists(self, weights):
+        lists = []
+        for order, (term_id, query_weight) in \
+                enumerate(self._query_terms(weights)):
+            docs, doc_weights = self.postings[term_id]
+            bound = query_weight * self.max_weights[term_id] * BOUND_SLACK
+            lists.append((bound, order, query_weight, docs, doc_weights))
+        return lists
+
+    def top_k(self, weights, k=10):
+        """
+        Top k (doc_id, score) for a {term id: weight} query with MaxScore
+        pruning (see maxscore_top_k). Returns exactly what exhaustive_top_k
+        returns
+        """
+        if k <= 0:
+            return []
+        return self._result(maxscore_top_k(self._posting_lists(weights), k))
+
+
+if __name__ == "__main__":
+    import random
+
+    rnd = random.Random(0)
+    terms = list(range(200))
+    inverted = InvertedIndex()
+    for n in range(3000):
+        # skewed term choice so some posting lists are long and common
+        doc_terms = set(terms[int(rnd.paretovariate(1.2)) % len(terms)]
+                        for _ in range(rnd.randint(1, 30)))
+        inverted.add_document(n, dict((t, rnd.choice([0.5, 1.0, rnd.random()]))
+                                      for t in doc_terms))
+    for _ in range(300):
+        query = dict((t, rnd.choice([1.0, rnd.random()]))
+                     for t in rnd.sample(terms[:40], rnd.randint(1, 6)))
+        k = rnd.choice([1, 5, 10, 50])
+        assert inverted.top_k(query, k) == inverted.exhaustive_top_k(query, k)
+    assert inverted.top_k({1000: 1.0}) == []
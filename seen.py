@@ -0,0 +1,285 @@
+"""
+Per user "already seen / already recommended" suppression with scalable
+Bloom filters: memory grows with the log of a user's history instead of
+with every post id, at the price of a bounded false positive rate
+
+A seen file holds, all integers little endian:
+
+    header     magic (8 bytes) | user count u32 | error rate f64
+    per user   id length u32 | utf-8 user id | filter count u32 |
+               per filter: capacity u32 | count u32 | hashes u32 |
+                           bit count u64 | bits
+"""
+
+import hashlib
+import math
+import os
+import struct
+
+
+MAGIC = b'IDSEENB2'
+_HEADER = struct.Struct('<8sId')
+_UINT = struct.Struct('<I')
+_FILTER = struct.Struct('<IIIQ')
+
+HEADROOM = 0.8
+
+
+def _probes(key, count, probes=None):
+    """
+    count independent 64 bit hashes of key, stable across processes and
+    machines, extending the hashes already in probes. Keys are hashed as
+    str(key), so 1 and '1' are the same key
+    """
+    probes = probes if probes is not None else []
+    data = str(key).encode('utf-8')
+    while len(probes) < count:
+        block = len(probes) // 8
+        digest = hashlib.blake2b(data, digest_size=64,
+                                 salt=block.to_bytes(16, 'little')).digest()
+        probes.extend(int.from_bytes(digest[i:i + 8], 'little')
+                      for i in range(0, 64, 8))
+    return probes
+
+
+class BloomFilter(object):
+    """ Fixed capacity Bloom filter sized for error_rate at capacity keys """
+
+    __slots__ = ('capacity', 'count', 'hashes', 'size', 'bits')
+
+    def __init__(self, capacity, error_rate, hashes=None, size=None,
+                 bits=None):
+        self.capacity = capacity
+        self.count = 0
+        if size is None:
+            size = max(8, int(math.ceil(
+                -capacity * math.log(error_rate) / math.log(2) ** 2)))
+            hashes = max(1, int(round(size / float(capacity) * math.log(2))))
+        self.hashes = hashes
+        self.size = size
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    def _positions(self, probes):
+        size = self.size
+        return [probe % size for probe in probes[:self.hashes]]
+
+    def add(self, probes):
+        """
+        Set the bits of a key given at least self.hashes of its _probes();
+        False if all were set
+        """
+        bits = self.bits
+        new = False
+        for position in self._positions(probes):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, probes):
+        bits = self.bits
+        for position in self._positions(probes):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class ScalableBloomFilter(object):
+    """
+    Chain of Bloom filters (Almeida et al.). When the newest filter is
+    full a filter growth times larger is added, each with a tightened
+    error rate so the compound false positive rate stays below error_rate
+    """
+
+    __slots__ = ('error_rate', 'initial_capacity', 'growth', 'tightening',
+                 'filters')
+
+    def __init__(self, error_rate=0.01, initial_capacity=64, growth=2,
+                 tightening=0.5):
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def __contains__(self, key):
+        if not self.filters:
+            return False
+        probes = _probes(key, max(f.hashes for f in self.filters))
+        for f in reversed(self.filters):
+            if probes in f:
+                return True
+        return False
+
+    def _next_error_rate(self):
+        # the filter error rates sum to HEADROOM * error_rate; the rest
+        # absorbs the fill variance of the small filters, whose actual rate
+        # runs above the one they were sized for
+        return HEADROOM * self.error_rate * (1 - self.tightening) * \
+            self.tightening ** len(self.filters)
+
+    def add(self, key):
+        probes = None
+        if self.filters:
+            probes = _probes(key, max(f.hashes for f in self.filters))
+            for f in self.filters:
+                if probes in f:
+                    return False
+        if not self.filters or self.filters[-1].count >= \
+                self.filters[-1].capacity:
+            capacity = self.initial_capacity * \
+                self.growth ** len(self.filters)
+            self.filters.append(BloomFilter(capacity,
+                                            self._next_error_rate()))
+        return self.filters[-1].add(
+            _probes(key, self.filters[-1].hashes, probes))
+
+    def nbytes(self):
+        return sum(len(f.bits) for f in self.filters)
+
+
+class SeenFilter(object):
+    """
+    Scalable Bloom filter of seen and recommended item ids per user.
+    seen(user_id, item_id) matches the Pipeline exclude hook, so
+    candidates are dropped at generation time in O(1); a false positive
+    hides an unseen post with probability of about error_rate. User and
+    item ids may be any value and are kept as str(id), which is what
+    save() writes and load() restores
+    """
+
+    def __init__(self, error_rate=0.01, initial_capacity=64):
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.users = {}
+
+    def __len__(self):
+        return len(self.users)
+
+    def add(self, user_id, item_ids):
+        """ Mark item_ids, e.g. the posts just recommended, as seen """
+        user_id = str(user_id)
+        bloom = self.users.get(user_id)
+        if bloom is None:
+            bloom = self.users[user_id] = ScalableBloomFilter(
+                self.error_rate, self.initial_capacity)
+        for item_id in item_ids:
+            bloom.add(item_id)
+
+    def seen(self, user_id, item_id):
+        bloom = self.users.get(str(user_id))
+        return bloom is not None and item_id in bloom
+
+    def remove(self, user_id):
+        self.users.pop(str(user_id), None)
+
+    def nbytes(self):
+        return sum(bloom.nbytes() for bloom in self.users.values())
+
+    def save(self, path):
+        """ Write all filters to path, replacing it atomically """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(self.users), self.error_rate))
+            for user_id, bloom in self.users.items():
+                name = user_id.encode('utf-8')
+                f.write(_UINT.pack(len(name)))
+                f.write(name)
+                f.write(_UINT.pack(len(bloom.filters)))
+                for bf in bloom.filters:
+                    f.write(_FILTER.pack(bf.capacity, bf.count, bf.hashes,
+                                         bf.size))
+                    f.write(bf.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, initial_capacity=64):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, users, error_rate = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a seen filter file" % path)
+        seen = cls(error_rate, initial_capacity)
+        position = _HEADER.size
+        for _ in range(users):
+            length, = _UINT.unpack_from(data, position)
+            position += _UINT.size
+            user_id = data[position:position + length].decode('utf-8')
+            position += length
+            count, = _UINT.unpack_from(data, position)
+            position += _UINT.size
+            bloom = ScalableBloomFilter(error_rate, initial_capacity)
+            for _ in range(count):
+                capacity, added, hashes, size = _FILTER.unpack_from(
+                    data, position)
+                position += _FILTER.size
+                nbytes = (size + 7) // 8
+                bf = BloomFilter(capacity, None, hashes, size,
+                                 bytearray(data[position:position + nbytes]))
+                bf.count = added
+                position += nbytes
+                bloom.filters.append(bf)
+            if bloom.filters:
+                bloom.initial_capacity = bloom.filters[0].capacity
+            seen.users[user_id] = bloom
+        return seen
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    # no false negatives, and the compound false positive rate of a chain
+    # of several filters stays below error_rate
+    for error_rate, probes in ((0.01, 100000), (0.001, 200000)):
+        bloom = ScalableBloomFilter(error_rate)
+        keys = ['in%d' % n for n in range(3000)]
+        for key in keys:
+            bloom.add(key)
+        assert len(bloom.filters) > 4
+        assert all(key in bloom for key in keys)
+        false_positives = sum(('out%d' % n) in bloom for n in range(probes))
+        assert false_positives <= error_rate * probes, \
+            (error_rate, false_positives / float(probes))
+        assert not bloom.add(keys[0])
+
+    seen = SeenFilter()
+    assert not seen.seen('u', 1)
+    seen.add('u', [1, 2])
+    seen.add(7, ['p1', 'p2'])
+    seen.add('big', range(500))
+    assert seen.seen('u', 1) and seen.seen('u', '2') and seen.seen('7', 'p1')
+    assert not seen.seen('u', 3) and not seen.seen(8, 'p1')
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'seen.bin')
+        seen.save(path)
+        loaded = SeenFilter.load(path)
+        assert len(loaded) == 3 and loaded.error_rate == seen.error_rate
+        assert loaded.seen(7, 'p2') and loaded.seen('u', 2)
+        assert all(loaded.seen('big', n) for n in range(500))
+        assert loaded.nbytes() == seen.nbytes()
+        assert len(loaded.users['big']) == len(seen.users['big'])
+        # restored filters keep growing the same way
+        loaded.add('big', range(500, 1000))
+        assert all(loaded.seen('big', n) for n in range(1000))
+        loaded.remove(7)
+        assert not loaded.seen(7, 'p1')
+
+        with open(path, 'wb') as f:
+            f.write(b'x' * 32)
+        try:
+            SeenFilter.load(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("loaded a file with a bad magic")
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,298 @@
+"""
+Asyncio HTTP recommendation service over an in-process index
+
+    GET /recommend?user=<user id>&k=10
+
+Concurrent requests are collected into small batches so their user
+profiles are scored against the post matrix as one matrix product
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs, urlsplit
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class MicroBatcher(object):
+    """
+    Collects submitted keys and calls score_batch(keys) -> results on
+    batches of up to max_batch, waiting at most max_wait seconds after the
+    first key of a batch for more to arrive. score_batch runs in the
+    default executor so the event loop keeps accepting requests
+    """
+
+    def __init__(self, score_batch, max_batch=64, max_wait=0.002):
+        self.score_batch = score_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._full = None
+        self._flusher = None
+
+    async def submit(self, key):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((key, future))
+        if self._flusher is None:
+            self._full = asyncio.Event()
+            self._flusher = loop.create_task(self._flush())
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _flush(self):
+        try:
+            await asyncio.wait_for(self._full.wait(), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        batch = self._pending[:self.max_batch]
+        self._pending = self._pending[self.max_batch:]
+        self._flusher = None
+        if self._pending:
+            self._full = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(
+                self._flush())
+            if len(self._pending) >= self.max_batch:
+                self._full.set()
+
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                None, self.score_batch, [key for key, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class RecommendationService(object):
+    """
+    Serves top k posts for a user from a similarity.DocumentMatrix and a
+    profiles.ProfileStore. own_posts(user_id), if given, lists posts to
+    leave out of the user's recommendations
+    """
+
+    def __init__(self, matrix, profiles, k=10, max_k=100, max_batch=64,
+                 max_wait=0.002, own_posts=None):
+        self.matrix = matrix
+        self.profiles = profiles
+        self.k = k
+        self.max_k = max_k
+        self.own_posts = own_posts
+        self.batcher = MicroBatcher(self._score_batch, max_batch, max_wait)
+
+    def _score_batch(self, keys):
+        user_ids = [user_id for user_id, _ in keys]
+        vectors = [self.profiles.vector(user_id) for user_id in user_ids]
+        excludes = None
+        if self.own_posts is not None:
+            excludes = [self.own_posts(user_id) for user_id in user_ids]
+        ranked = self.matrix.query_many(vectors, max(k for _, k in keys),
+                                        excludes)
+        return [result[:k] for result, (_, k) in zip(ranked, keys)]
+
+    async def recommend(self, user_id, k=None):
+        """ [(doc_id, score)] for user_id, scored in a micro batch """
+        if k is not None and k < 1:
+            raise ValueError("k must be at least 1")
+        k = min(k or self.k, self.max_k)
+        return await self.batcher.submit((user_id, k))
+
+    async def _respond(self, path):
+        url = urlsplit(path)
+        if url.path != '/recommend':
+            return 404, {'error': 'not found'}
+        params = parse_qs(url.query)
+        user_id = params.get('user', [None])[0]
+        if not user_id:
+            return 400, {'error': 'missing user'}
+        try:
+            k = int(params.get('k', [self.k])[0])
+        except ValueError:
+            return 400, {'error': 'bad k'}
+        if k < 1:
+            return 400, {'error': 'bad k'}
+        ranked = await self.recommend(user_id, k)
+        return 200, {'user': user_id,
+                     'items': [{'id': doc_id, 'score': score}
+                               for doc_id, score in ranked]}
+
+    async def handle(self, reader, writer):
+        """ Serve HTTP/1.1 requests on one keep-alive connection """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if length > 0:
+                    await reader.readexactly(length)
+
+                parts = request_line.decode('latin-1').split()
+                if length < 0:
+                    # the body cannot be skipped, so the connection closes
+                    status, body = 400, {'error': 'bad content-length'}
+                elif len(parts) != 3 or parts[0] != 'GET':
+                    status, body = 405, {'error': 'method not allowed'}
+                else:
+                    try:
+                        status, body = await self._respond(parts[1])
+                    except Exception:
+                        status, body = 500, {'error': 'internal error'}
+                keep_alive = parts[-1:] == ['HTTP/1.1'] and \
+                    headers.get('connection', '').lower() != 'close' and \
+                    length >= 0
+
+                data = json.dumps(body).encode('utf-8')
+                writer.write((
+                    'HTTP/1.1 %d %s\r\n'
+                    'Content-Type: application/json\r\n'
+                    'Content-Length: %d\r\n'
+                    'Connection: %s\r\n\r\n' % (
+                        status, _REASONS.get(status, 'Error'), len(data),
+                        'keep-alive' if keep_alive else 'close'))
+                    .encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """ Start listening; returns the asyncio server """
+        return await asyncio.start_server(self.handle, host, port)
+
+
+if __name__ == "__main__":
+    class Matrix(object):
+        """ Stand-in for similarity.DocumentMatrix: post n scores n * weight """
+
+        def query_many(self, vectors, k=10, excludes=None):
+            results = []
+            for i, weights in enumerate(vectors):
+                exclude = excludes[i] if excludes else ()
+                ranked = [('p%d' % n, float(n * weights.get(0, 0.0)))
+                          for n in range(20, 0, -1)
+                          if 'p%d' % n not in exclude]
+                results.append(ranked[:k])
+            return results
+
+    class Profiles(object):
+        def vector(self, user_id):
+            return {0: float(len(user_id))}
+
+    async def request(reader, writer, path, headers=(), version='HTTP/1.1'):
+        """ Send one GET, return (status, headers, body) of the reply """
+        writer.write(('GET %s %s\r\n%s\r\n' % (
+            path, version, ''.join(h + '\r\n' for h in headers)))
+            .encode('latin-1'))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        reply = {}
+        while True:
+            line = await reader.readline()
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            reply[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(reply['content-length']))
+        return status, reply, json.loads(body.decode('utf-8'))
+
+    async def self_check():
+        service = RecommendationService(Matrix(), Profiles(), max_wait=0.05,
+                                        own_posts=lambda user_id: ['p20'])
+        batches = []
+        score_batch = service.batcher.score_batch
+
+        def counted(keys):
+            batches.append(list(keys))
+            return score_batch(keys)
+        service.batcher.score_batch = counted
+
+        handlers = [0]
+        handle = service.handle
+
+        async def handle_counted(reader, writer):
+            handlers[0] += 1
+            try:
+                await handle(reader, writer)
+            finally:
+                handlers[0] -= 1
+        service.handle = handle_counted
+
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        connections = [await asyncio.open_connection('127.0.0.1', port)
+                       for _ in range(8)]
+        try:
+            # concurrent requests are scored as one batch
+            replies = await asyncio.wait_for(asyncio.gather(*[
+                request(reader, writer, '/recommend?user=u%d&k=%d' % (n, n + 1))
+                for n, (reader, writer) in enumerate(connections)]), 5)
+            assert len(batches) == 1 and len(batches[0]) == 8
+            for n, (status, headers, body) in enumerate(replies):
+                assert status == 200 and headers['connection'] == 'keep-alive'
+                assert body['user'] == 'u%d' % n
+                assert [item['id'] for item in body['items']] == \
+                    ['p%d' % m for m in range(19, 18 - n, -1)]
+
+            # client errors keep the connection open
+            reader, writer = connections[0]
+            for path, status, error in [
+                    ('/recommend?user=u&k=0', 400, 'bad k'),
+                    ('/recommend?user=u&k=x', 400, 'bad k'),
+                    ('/recommend?k=3', 400, 'missing user'),
+                    ('/elsewhere', 404, 'not found')]:
+                reply = await request(reader, writer, path)
+                assert reply[0] == status and reply[2] == {'error': error}
+                assert reply[1]['connection'] == 'keep-alive'
+            status, _, body = await request(reader, writer,
+                                            '/recommend?user=u&k=1')
+            assert status == 200 and body['items'][0]['id'] == 'p19'
+
+            # a body that cannot be skipped closes the connection
+            reply = await request(reader, writer, '/recommend?user=u',
+                                  ['Content-Length: many'])
+            assert reply[0] == 400 and reply[1]['connection'] == 'close'
+            assert await reader.read() == b''
+
+            # so do HTTP/1.0 and Connection: close
+            reader, writer = connections[1]
+            reply = await request(reader, writer, '/recommend?user=u',
+                                  ['Connection: close'])
+            assert reply[0] == 200 and reply[1]['connection'] == 'close'
+            assert await reader.read() == b''
+            reader, writer = connections[2]
+            reply = await request(reader, writer, '/nothing',
+                                  version='HTTP/1.0')
+            assert reply[0] == 404 and reply[1]['connection'] == 'close'
+            assert await reader.read() == b''
+        finally:
+            for _, writer in connections:
+                writer.close()
+            # let the handlers see the clients go before shutting down
+            while handlers[0]:
+                await asyncio.sleep(0.01)
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(self_check())
@@ -0,0 +1,213 @@
+"""
+Stemmed corpus as an integer id vocabulary plus a CSR matrix of weighted
+term counts, with cosine top-k "similar posts" and "posts for this user"
+queries run as sparse matrix-vector products
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+def top_k(scores, k):
+    """
+    Indices of the k highest positive scores, best first, using a partial
+    sort (argpartition) instead of sorting every score
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return candidates[scores[candidates] > 0]
+
+
+class DocumentMatrix(object):
+    """
+    One L2 normalized TF-IDF row per document. Columns are the term ids
+    of vocabulary and doc_ids lists the document of every row. Rows are kept
+    in CSR form for document vectors and in CSC form so a query only reads
+    the columns of its own terms
+    """
+
+    def __init__(self, doc_ids, vocabulary, matrix):
+        self.doc_ids = list(doc_ids)
+        self.rows = dict((doc_id, row) for row, doc_id in
+                         enumerate(self.doc_ids))
+        self.vocabulary = vocabulary
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        self.by_term = self.matrix.tocsc()
+
+    @classmethod
+    def from_index(cls, index):
+        """ Snapshot a TfidfIndex """
+        doc_ids = []
+        indptr = [0]
+        indices = []
+        data = []
+        for doc_id in index.docs:
+            term_ids, weights = index.arrays(doc_id)
+            doc_ids.append(doc_id)
+            indices.append(term_ids)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(term_ids))
+        matrix = sparse.csr_matrix(
+            (np.concatenate(data).astype(np.float32) if data
+             else np.empty(0, dtype=np.float32),
+             np.concatenate(indices).astype(np.int32) if indices
+             else np.empty(0, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(doc_ids), len(index.vocabulary)))
+        return cls(doc_ids, index.vocabulary, matrix)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _columns(self, weights):
+        """
+        (columns, weights) arrays of a {term id: weight} mapping, without
+        terms added to the vocabulary after the snapshot
+        """
+        columns = np.fromiter(weights.keys(), dtype=np.intp,
+                              count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float32,
+                             count=len(weights))
+        known = columns < self.matrix.shape[1]
+        return columns[known], values[known]
+
+    def _column_scores(self, columns, values):
+        if not len(columns):
+            return np.zeros(len(self.doc_ids), dtype=np.float32)
+        return self.by_term[:, columns].dot(values)
+
+    def scores(self, weights):
+        """ Dot product of every document with a {term id: weight} vector """
+        return self._column_scores(*self._columns(weights))
+
+    def _ranked(self, scores, k, exclude_rows=()):
+        if len(exclude_rows):
+            scores[np.asarray(list(exclude_rows), dtype=np.intp)] = -np.inf
+        return [(self.doc_ids[row], float(scores[row]))
+                for row in top_k(scores, k)]
+
+    def query(self, weights, k=10, exclude=()):
+        """
+        Top k (doc_id, cosine) for a {term id: weight} vector, e.g. a user
+        profile. Documents in exclude are left out
+        """
+        rows = [self.rows[doc_id] for doc_id in exclude if doc_id in self.rows]
+        return self._ranked(self.scores(weights), k, rows)
+
+    def query_many(self, vectors, k=10, excludes=None):
+        """
+        query() for a batch of {term id: weight} vectors, scored as one
+        sparse matrix product. excludes is an optional list with the
+        doc ids to leave out for every vector
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for weights in vectors:
+            columns, values = self._columns(weights)
+            indices.extend(columns)
+            data.extend(values)
+            indptr.append(len(indices))
+        queries = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32),
+             np.asarray(indices, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(vectors), self.matrix.shape[1]))
+        scores = queries.dot(self.by_term.T).toarray()
+        results = []
+        for i in range(len(vectors)):
+            exclude = excludes[i] if excludes else ()
+            rows = [self.rows[doc_id] for doc_id in exclude
+                    if doc_id in self.rows]
+            results.append(self._ranked(scores[i], k, rows))
+        return results
+
+    def similar(self, doc_id, k=10):
+        """ Top k documents most similar to an indexed document """
+        row = self.rows[doc_id]
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        scores = self._column_scores(self.matrix.indices[start:end],
+                                     self.matrix.data[start:end])
+        return self._ranked(scores, k, [row])
+
+    def for_user(self, doc_ids, k=10):
+        """
+        Top k documents for a user, scored against the normalized centroid
+        of the rows of the user's own posts, which are excluded
+        """
+        rows = [self.rows[doc_id] for doc_id in doc_ids if doc_id in self.rows]
+        if not rows:
+            return []
+        centroid = np.asarray(self.matrix[rows].sum(axis=0)).ravel()
+        columns = np.flatnonzero(centroid)
+        values = centroid[columns]
+        norm = np.linalg.norm(values)
+        if norm:
+            values /= norm
+        return self._ranked(self._column_scores(columns, values), k, rows)
+
+
+if __name__ == "__main__":
+    import random
+
+    from index import TfidfIndex
+    from retrieval import InvertedIndex
+
+    rnd = random.Random(0)
+    stems = [u'stem%d' % n for n in range(300)]
+    index = TfidfIndex()
+    for n in range(800):
+        index.add_document('d%d' % n,
+                           [stems[int(rnd.paretovariate(1.1)) % len(stems)]
+                            for _ in range(rnd.randint(1, 40))])
+    posts = DocumentMatrix.from_index(index)
+    inverted = InvertedIndex.from_index(index)
+
+    def assert_same_ranking(ranked, expected, weights):
+        """
+        Same documents in the same order. Rows are float32, so only
+        documents whose exact scores are all but equal may trade places
+        """
+        scores = dict(inverted.exhaustive_top_k(weights, len(inverted)))
+        assert len(ranked) == len(expected)
+        for (doc_id, score), (other, expected_score) in zip(ranked, expected):
+            assert abs(score - expected_score) < 1e-5
+            assert doc_id == other or \
+                abs(scores.get(doc_id, 0.0) - expected_score) < 1e-5
+
+    queries = [index.query(rnd.sample(stems[:60], rnd.randint(1, 6)))
+               for _ in range(100)]
+    excludes = [['d%d' % rnd.randrange(800) for _ in range(rnd.randint(0, 3))]
+                for _ in queries]
+    for k in (1, 10, 50):
+        batch = posts.query_many(queries, k)
+        for weights, ranked in zip(queries, batch):
+            expected = inverted.top_k(weights, k)
+            assert_same_ranking(posts.query(weights, k), expected, weights)
+            assert_same_ranking(ranked, expected, weights)
+
+        # excludes drop documents without changing the rest of the order
+        batch = posts.query_many(queries, k, excludes)
+        for weights, exclude, ranked in zip(queries, excludes, batch):
+            expected = [(doc_id, score) for doc_id, score in
+                        inverted.top_k(weights, k + len(exclude))
+                        if doc_id not in exclude][:k]
+            assert_same_ranking(posts.query(weights, k, exclude), expected,
+                                weights)
+            assert_same_ranking(ranked, expected, weights)
+
+    # similar posts rank like a query with the post's own vector
+    for doc_id in ['d0', 'd7', 'd123']:
+        weights = index.vector(doc_id)
+        expected = [(other, score) for other, score in
+                    inverted.top_k(weights, 11) if other != doc_id][:10]
+        assert_same_ranking(posts.similar(doc_id), expected, weights)
+
+    assert posts.query({10 ** 6: 1.0}) == [] and posts.query({}) == []
+    assert list(top_k(np.array([0.0, 2.0, -1.0, 1.0]), 3)) == [1, 3]
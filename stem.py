@@ -1,1031 +1,1257 @@
 
+import threading
+from array import array
+from collections import OrderedDict
+
 from nltk.stem.snowball import StemmerI
 
 
+class StemCache(object):
+    """
+    Size bounded LRU mapping of word -> stem with hit/miss/eviction counters
+    """
+
+    def __init__(self, maxsize=10000):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, word):
+        return word in self._data
+
+    def get(self, word):
+        """ Return the cached stem of word or None, counting hit/miss """
+        with self._lock:
+            try:
+                stem = self._data[word]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(word)
+            self.hits += 1
+            return stem
+
+    def put(self, word, stem):
+        with self._lock:
+            self._data[word] = stem
+            self._data.move_to_end(word)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Drop all entries and reset the counters """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def info(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize}
+
+
+REMOVED_KE = 1
+REMOVED_PENG = 2
+REMOVED_DI = 4
+REMOVED_MENG = 8
+REMOVED_TER = 16
+REMOVED_BER = 32
+REMOVED_PE = 64
+
+
+# The stemming rules below are pure functions: every step takes the current
+# (word, flags, num_syllables) and returns the updated triple, so nothing is
+# shared between calls and they can run from many threads at once.
+
+def _is_vowel(letter):
+    """
+    Vowels in indonesian
+    """
+    return letter in u'aeiou'
+
+
+def _remove_particle(word, flags, num_syllables):
+    """ 
+    Remove common indonesian particles, adjust number of syllables 
+    """
+    if word[-3:] in (u'kah', u'lah', u'pun'):
+        return word[:-3], flags, num_syllables - 1
+    return word, flags, num_syllables
+
+
+def _remove_possessive_pronoun(word, flags, num_syllables):
+    """
+    Remove possessive pronoun particles
+    """
+    if word[-2:] in (u'ku', u'mu'):
+        return word[:-2], flags, num_syllables - 2
+    
+    if word[-3:] == u'nya':
+        return word[:-3], flags, num_syllables - 1
+    return word, flags, num_syllables
+
+
+def _remove_first_order_prefix(word, flags, num_syllables):
+    """ Remove FIRST ORDER PREFIX """
+    if word.startswith(u'meng'):
+        return word[4:], flags | REMOVED_MENG, num_syllables - 1
+    
+    if word.startswith(u'meny') and len(word) > 4 and _is_vowel(word[4]):
+        return u's' + word[4:], flags | REMOVED_MENG, num_syllables - 1
+    
+    if word[0:3] in (u'men', u'mem'):
+        return word[3:], flags | REMOVED_MENG, num_syllables - 1
+    
+    if word.startswith(u'me'):
+        return word[2:], flags | REMOVED_MENG, num_syllables - 1
+    
+    if word.startswith(u'peng'):
+        return word[4:], flags | REMOVED_PENG, num_syllables - 1
+    
+    if word.startswith(u'peny') and len(word) > 4 and _is_vowel(word[4]):
+        return u's' + word[4:], flags | REMOVED_PENG, num_syllables - 1
+    
+    if word.startswith(u'peny'):
+        return word[4:], flags | REMOVED_PENG, num_syllables - 1
+    
+    if word.startswith(u'pen') and len(word) > 3 and _is_vowel(word[3]):
+        return u't' + word[3:], flags | REMOVED_PENG, num_syllables - 1
+    
+    if word[0:3] in (u'pen', u'pem'):
+        return word[2:], flags | REMOVED_PENG, num_syllables - 1
+    
+    if word.startswith(u'di'):
+        return word[2:], flags | REMOVED_DI, num_syllables - 1
+    
+    if word.startswith(u'ter'):
+        return word[3:], flags | REMOVED_TER, num_syllables - 1
+    
+    if word.startswith(u'ke'):
+        return word[2:], flags | REMOVED_KE, num_syllables - 1
+    return word, flags, num_syllables
+
+
+def _remove_second_order_prefix(word, flags, num_syllables):
+    """ Remove SECOND ORDER PREFIX """
+    if word.startswith(u'ber'):
+        return word[3:], flags | REMOVED_BER, num_syllables - 1
+    
+    if word == u'belajar':
+        return word[3:], flags | REMOVED_BER, num_syllables - 1
+    
+    if word.startswith(u'be') and len(word) > 4 and \
+       not _is_vowel(word[2]) and word[3] == u'e' and word[4] == u'r':
+        return word[2:], flags | REMOVED_BER, num_syllables - 1
+    
+    if word.startswith(u'per'):
+        return word[3:], flags, num_syllables - 1
+    
+    if word == u'pelajar':
+        return word[3:], flags, num_syllables - 1
+    
+    if word.startswith(u'pe'):
+        return word[2:], flags | REMOVED_PE, num_syllables - 1
+    return word, flags, num_syllables
+
+
+def _remove_suffix(word, flags, num_syllables):
+    if word.endswith(u'kan') \
+       and not flags & (REMOVED_KE | REMOVED_PENG | REMOVED_PE):
+        return word[:-3], flags, num_syllables - 1
+    
+    if word.endswith(u'an') \
+       and not flags & (REMOVED_DI | REMOVED_MENG | REMOVED_TER):
+        return word[:-2], flags, num_syllables - 1
+    
+    if word.endswith(u'i') and not word.endswith(u'si') \
+       and not flags & (REMOVED_BER | REMOVED_KE | REMOVED_PENG):
+        return word[:-1], flags, num_syllables - 1
+    return word, flags, num_syllables
+
+
+def _stem_derivational(word, flags, num_syllables, rules):
+    """
+    rules is a (first order prefix, second order prefix, suffix) triple of
+    step functions, either the compiled tables or the reference cascade
+    """
+    first_order_prefix, second_order_prefix, suffix = rules
+    old_length = len(word)
+    
+    if num_syllables > 2:
+        word, flags, num_syllables = \
+            first_order_prefix(word, flags, num_syllables)
+    
+    if old_length != len(word): # A rule has fired
+        if num_syllables > 2:
+            word, flags, num_syllables = suffix(word, flags, num_syllables)
+        
+        # The original cascade referenced _remove_second_order_prefix here
+        # without calling it, so a second order prefix is never removed
+        # after a first order prefix and suffix. Kept for identical output.
+    
+    else: # fail
+        if num_syllables > 2:
+            word, flags, num_syllables = \
+                second_order_prefix(word, flags, num_syllables)
+        
+        if num_syllables > 2:
+            word, flags, num_syllables = suffix(word, flags, num_syllables)
+    
+    return word, flags, num_syllables
+
+
+# Compiled rule engine. The prefix and suffix cascades above are written
+# out once more as ordered rule tables and grouped by their first (prefix)
+# or last (suffix) letter, so a word is only tested against the handful of
+# rules that can possibly match. Order within a group is the cascade order.
+
+def _vowel_at(i):
+    return lambda word: len(word) > i and word[i] in u'aeiou'
+
+
+def _exact(form):
+    return lambda word: word == form
+
+
+def _consonant_er(word):
+    """ be + consonant + er, e.g. bekerja """
+    return len(word) > 4 and word[2] not in u'aeiou' \
+        and word[3] == u'e' and word[4] == u'r'
+
+
+def _not_si(word):
+    return not word.endswith(u'si')
+
+
+# prefix, guard, characters removed, replacement, flag
+FIRST_ORDER_PREFIX_RULES = (
+    (u'meng', None, 4, u'', REMOVED_MENG),
+    (u'meny', _vowel_at(4), 4, u's', REMOVED_MENG),
+    (u'men', None, 3, u'', REMOVED_MENG),
+    (u'mem', None, 3, u'', REMOVED_MENG),
+    (u'me', None, 2, u'', REMOVED_MENG),
+    (u'peng', None, 4, u'', REMOVED_PENG),
+    (u'peny', _vowel_at(4), 4, u's', REMOVED_PENG),
+    (u'peny', None, 4, u'', REMOVED_PENG),
+    (u'pen', _vowel_at(3), 3, u't', REMOVED_PENG),
+    (u'pen', None, 2, u'', REMOVED_PENG),
+    (u'pem', None, 2, u'', REMOVED_PENG),
+    (u'di', None, 2, u'', REMOVED_DI),
+    (u'ter', None, 3, u'', REMOVED_TER),
+    (u'ke', None, 2, u'', REMOVED_KE),
+)
+
+SECOND_ORDER_PREFIX_RULES = (
+    (u'ber', None, 3, u'', REMOVED_BER),
+    (u'bel', _exact(u'belajar'), 3, u'', REMOVED_BER),
+    (u'be', _consonant_er, 2, u'', REMOVED_BER),
+    (u'per', None, 3, u'', 0),
+    (u'pel', _exact(u'pelajar'), 3, u'', 0),
+    (u'pe', None, 2, u'', REMOVED_PE),
+)
+
+# suffix, guard, flags that block the rule
+SUFFIX_RULES = (
+    (u'kan', None, REMOVED_KE | REMOVED_PENG | REMOVED_PE),
+    (u'an', None, REMOVED_DI | REMOVED_MENG | REMOVED_TER),
+    (u'i', _not_si, REMOVED_BER | REMOVED_KE | REMOVED_PENG),
+)
+
+
+def _group_rules(rules, key):
+    table = {}
+    for rule in rules:
+        table.setdefault(key(rule[0]), []).append(rule)
+    return dict((letter, tuple(group)) for letter, group in table.items())
+
+
+def _compile_prefix_rules(rules):
+    table = _group_rules(rules, lambda prefix: prefix[0])
+    
+    def remove_prefix(word, flags, num_syllables):
+        for prefix, guard, cut, replacement, flag in table.get(word[:1], ()):
+            if word.startswith(prefix) and (guard is None or guard(word)):
+                return replacement + word[cut:], flags | flag, \
+                    num_syllables - 1
+        return word, flags, num_syllables
+    
+    return remove_prefix
+
+
+def _compile_suffix_rules(rules):
+    table = _group_rules(rules, lambda suffix: suffix[-1])
+    
+    def remove_suffix(word, flags, num_syllables):
+        for suffix, guard, blocked in table.get(word[-1:], ()):
+            if word.endswith(suffix) and not flags & blocked \
+               and (guard is None or guard(word)):
+                return word[:-len(suffix)], flags, num_syllables - 1
+        return word, flags, num_syllables
+    
+    return remove_suffix
+
+
+_COMPILED_RULES = (_compile_prefix_rules(FIRST_ORDER_PREFIX_RULES),
+                   _compile_prefix_rules(SECOND_ORDER_PREFIX_RULES),
+                   _compile_suffix_rules(SUFFIX_RULES))
+
+_REFERENCE_RULES = (_remove_first_order_prefix,
+                    _remove_second_order_prefix,
+                    _remove_suffix)
+
+
+def _stem_word(word, stem_derivational, rules):
+    flags = 0
+    # number of syllables == number of vowels
+    num_syllables = word.count(u'a') + word.count(u'e') + word.count(u'i') \
+        + word.count(u'o') + word.count(u'u')
+    
+    if num_syllables > 2:
+        word, flags, num_syllables = \
+            _remove_particle(word, flags, num_syllables)
+    
+    if num_syllables >= 2:
+        word, flags, num_syllables = \
+            _remove_possessive_pronoun(word, flags, num_syllables)
+    
+    if stem_derivational:
+        word, flags, num_syllables = \
+            _stem_derivational(word, flags, num_syllables, rules)
+    
+    return word
+
+
+def stem_word(word, stem_derivational=True):
+    """
+    Stem a single word. Pure function, safe to call from many threads
+    """
+    return _stem_word(word, stem_derivational, _COMPILED_RULES)
+
+
+def reference_stem_word(word, stem_derivational=True):
+    """
+    stem_word through the original startswith cascade, kept as the
+    reference the compiled rule tables are checked against
+    """
+    return _stem_word(word, stem_derivational, _REFERENCE_RULES)
+
+
 class IndonesianStemmer(StemmerI):
     """
-    The indonesian snowball stemmer
+    The indonesian snowball stemmer. Holds no per-word state, so a single
+    instance can be shared between threads
     """    
     
-    REMOVED_KE = 1;
-    REMOVED_PENG = 2;
-    REMOVED_DI = 4;
-    REMOVED_MENG = 8;
-    REMOVED_TER = 16;
-    REMOVED_BER = 32;
-    REMOVED_PE = 64;
+    REMOVED_KE = REMOVED_KE
+    REMOVED_PENG = REMOVED_PENG
+    REMOVED_DI = REMOVED_DI
+    REMOVED_MENG = REMOVED_MENG
+    REMOVED_TER = REMOVED_TER
+    REMOVED_BER = REMOVED_BER
+    REMOVED_PE = REMOVED_PE
     
-    def __init__(self):
-        self.num_syllables = 0
+    def __init__(self, cache_size=None, lexicon=None):
+        """
+        cache_size enables a StemCache of that many words, None disables it.
+        lexicon is an optional precomputed word -> stem mapping with a get
+        method (see lexicon.StemLexicon) consulted after the cache and
+        before the rules; lexicon hits are cached like computed stems
+        """
         self.stem_derivational = True
+        self.cache = StemCache(cache_size) if cache_size else None
+        self.lexicon = lexicon
         
 
     def stem(self, word):
-        self.flags = 0
-        # number of syllables == number of vowels
-        self.num_syllables = len([c for c in word if self._is_vowel(c)])
-        self.word = word
-        
-        if self.num_syllables > 2:
-            self._remove_particle()
-            
-        if self.num_syllables >= 2:
-            self._remove_possessive_pronoun()
-            
-        if self.stem_derivational:
-            self._stem_derivational()
-        
-        return self.word
+        if self.cache is None:
+            return self._stem_uncached(word)
+
+        stem = self.cache.get(word)
+        if stem is None:
+            stem = self._stem_uncached(word)
+            self.cache.put(word, stem)
+        return stem
+
+    def _stem_uncached(self, word):
+        if self.lexicon is not None:
+            stem = self.lexicon.get(word)
+            if stem is not None:
+                return stem
+        return self._stem(word)
     
-    def _is_vowel(self, letter):
+    def stem_tokens(self, words):
         """
-        Vowels in indonesian
+        Stem each distinct word once. Returns (forms, stems, index) where
+        forms are the distinct input words in order of first appearance,
+        stems[i] is the stem of forms[i] and index is an array('I') with
+        words[j] == forms[index[j]]
         """
-        return letter in [u'a', u'e', u'i', u'o', u'u']
+        positions = {}
+        forms = []
+        index = array('I')
+        for word in words:
+            pos = positions.get(word)
+            if pos is None:
+                pos = positions[word] = len(forms)
+                forms.append(word)
+            index.append(pos)
+        stems = [self.stem(form) for form in forms]
+        return forms, stems, index
     
-    def _remove_particle(self):
-        """ 
-        Remove common indonesian particles, adjust number of syllables 
-        """
-        suffix = self.word[-3:]
-        if suffix in [u'kah', u'lah', u'pun']:
-            self.num_syllables -= 1
-            self.word = self.word[:-3]
-            
-    def _remove_possessive_pronoun(self):
-        """
-        Remove possessive pronoun particles
-        """
-        if self.word[-2:] in [u'ku', u'mu']:
-            self.num_syllables -= 2
-            self.word = self.word[:-2]
-            return
-        
-        if self.word[-3:] == u'nya':
-            self.num_syllables -= 1
-            self.word = self.word[:-3]
-            
-    def _stem_derivational(self):
-        old_length = len(self.word)
-        
-        if self.num_syllables > 2:
-            self._remove_first_order_prefix()
-        
-        if old_length != len(self.word): # A rule has fired
-            old_length = len(self.word)
-
-            if self.num_syllables > 2:
-                self._remove_suffix()
-                
-            if old_length != len(self.word): # A rule has fired
-                if self.num_syllables > 2:
-                    self._remove_second_order_prefix
-                        
-        else: # fail
-            if self.num_syllables > 2:
-                self._remove_second_order_prefix()
-                
-            if self.num_syllables > 2:
-                self._remove_suffix()
-                
-                
-    def _remove_first_order_prefix(self):
-        """ Remove FIRST ORDER PREFIX """
-        if self.word.startswith(u'meng'):
-            self.flags |= IndonesianStemmer.REMOVED_MENG
-            self.num_syllables -= 1
-            self.word = self.word[4:]
-            return
-        
-        if self.word.startswith(u'meny') and \
-           len(self.word) > 4 and self._is_vowel(self.word[4]):
-            self.flags |= IndonesianStemmer.REMOVED_MENG
-            self.word = self.word[0:3] + u's' + self.word[4:] 
-            self.num_syllables -= 1
-            self.word = self.word[3:]
-            return
-        
-        if self.word[0:3] in [u'men', u'mem']:
-            self.flags |= IndonesianStemmer.REMOVED_MENG
-            self.num_syllables -= 1
-            self.word = self.word[3:]
-            return
-        
-        if self.word.startswith(u'me'):
-            self.flags |= IndonesianStemmer.REMOVED_MENG
-            self.num_syllables -= 1
-            self.word = self.word[2:]
-            return
-
-        if self.word.startswith(u'peng'):
-            self.flags |= IndonesianStemmer.REMOVED_PENG
-            self.num_syllables -= 1
-            self.word = self.word[4:]
-            return        
-
-        if self.word.startswith(u'peny') and \
-            len(self.word) > 4 and self._is_vowel(self.word[4]):
-             self.flags |= IndonesianStemmer.REMOVED_PENG
-             #self.word[3] = u's'
-             self.word = self.word[0:3] + u's' + self.word[4:]
-             self.num_syllables -= 1
-             self.word = self.word[3:]
-             return        
-        
-        if self.word.startswith(u'peny'):
-            self.flags |= IndonesianStemmer.REMOVED_PENG
-            self.num_syllables -= 1
-            self.word = self.word[4:]
-            return
-        
-        if self.word.startswith(u'pen') and \
-           len(self.word) > 3 and self._is_vowel(self.word[3]):
-            self.flags |= IndonesianStemmer.REMOVED_PENG
-            #self.word[2] = u't'
-            self.word = self.word[0:2] + u't' + self.word[3:]
-            self.num_syllables -= 1
-            self.word = self.word[2:]
-            return
-        
-        if self.word[0:3] in [u'pen', u'pem']:
-            self.flags |= IndonesianStemmer.REMOVED_PENG
-            self.num_syllables -= 1
-            self.word = self.word[2:]
-            return
-        
-        if self.word.startswith(u'di'):
-            self.flags |= IndonesianStemmer.REMOVED_DI
-            self.num_syllables -= 1
-            self.word = self.word[2:]
-            return
-        
-        if self.word.startswith(u'ter'):
-            self.flags |= IndonesianStemmer.REMOVED_TER
-            self.num_syllables -= 1
-            self.word = self.word[3:]
-            return 
-        
-        if self.word.startswith(u'ke'):
-            self.flags |= IndonesianStemmer.REMOVED_KE
-            self.num_syllables -= 1
-            self.word = self.word[2:]
-            return        
-        
-    def _remove_second_order_prefix(self):
-        """ Remove SECOND ORDER PREFIX """
-        if self.word.startswith(u'ber'):
-            self.flags |= IndonesianStemmer.REMOVED_BER
-            self.num_syllables -= 1
-            self.word = self.word[3:]
-            return
-            
-        if self.word == u'belajar':
-            self.flags |= IndonesianStemmer.REMOVED_BER
-            self.num_syllables -= 1
-            self.word = self.word[3:]
-            return
-        
-        if self.word.startswith(u'be') and len(self.word) > 4 and \
-           not self._is_vowel(self.word[2]) \
-           and self.word[3] == u'e' and self.word[4] == 'r':
-            self.flags |= IndonesianStemmer.REMOVED_BER
-            self.num_syllables -= 1
-            self.word = self.word[2:]
-            return
-        
-        if self.word.startswith(u'per'):
-            self.num_syllables -= 1
-            self.word = self.word[3:]
-            return
-        
-        if self.word == u'pelajar':
-            self.num_syllables -= 1
-            self.word = self.word[3:]
-            return
-        
-        if self.word.startswith(u'pe'):
-            self.flags |= IndonesianStemmer.REMOVED_PE
-            self.num_syllables -= 1
-            self.word = self.word[2:]
-            return
-            
-    def _remove_suffix(self):
-        if self.word.endswith(u'kan') \
-           and not self.flags & IndonesianStemmer.REMOVED_KE \
-           and not self.flags & IndonesianStemmer.REMOVED_PENG \
-           and not self.flags & IndonesianStemmer.REMOVED_PE:
-            self.num_syllables -= 1
-            self.word = self.word[:-3]
-            return
-        
-        if self.word.endswith(u'an') \
-           and not self.flags & IndonesianStemmer.REMOVED_DI \
-           and not self.flags & IndonesianStemmer.REMOVED_MENG \
-           and not self.flags & IndonesianStemmer.REMOVED_TER:
-            self.num_syllables -= 1
-            self.word = self.word[:-2]
-            return
-        
-        if self.word.endswith(u'i') \
-           and not self.word.endswith(u'si') \
-           and not self.flags & IndonesianStemmer.REMOVED_BER \
-           and not self.flags & IndonesianStemmer.REMOVED_KE \
-           and not self.flags & IndonesianStemmer.REMOVED_PENG:
-            self.num_syllables -= 1
-            self.word = self.word[:-1]
-            return
+    def stem_many(self, words):
+        """ Stem an iterable of words, returning the stems in input order """
+        forms, stems, index = self.stem_tokens(words)
+        return [stems[i] for i in index]
+    
+    def cache_info(self):
+        """ Cache counters, or None when caching is disabled """
+        if self.cache is None:
+            return None
+        return self.cache.info()
+    
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+    
+    def _stem(self, word):
+        return stem_word(word, self.stem_derivational)
     
     def stop_words(self):
         """return list of Indonesian stop words"""
         
-        return ['tiba-tiba',
-                 'kepada',
-                 'mengapa',
-                 'haruslah',
-                 'secukupnya',
-                 'sekaligus',
-                 'tiba',
-                 'per',
-                 'kata',
-                 'kesampaian',
-                 'sedikitnya',
-                 'sejak',
-                 'kamulah',
-                 'dikarenakan',
-                 'to',
-                 'setibanya',
-                 'setempat',
-                 'ialah',
-                 'turut',
-                 'sekali-kali',
-                 'seluruh',
-                 'utama',
-                 'sesaat',
-                 'hendaklah',
-                 'ingin',
-                 'depan',
-                 'sebanyak',
-                 'siapa',
-                 'lain',
-                 'tersebut',
-                 'diketahui',
-                 'dimisalkan',
-                 'meminta',
-                 'sekurang-kurangnya',
-                 'kapanpun',
-                 'amatlah',
-                 'semakin',
-                 'selamanya',
-                 'dia',
-                 'seseorang',
-                 'bagaimana',
-                 'gunakan',
-                 'sana',
-                 'sebagainya',
-                 'menyangkut',
-                 'makanya',
-                 'karenanya',
-                 'umum',
-                 'bung',
-                 'diberi',
-                 'biasanya',
-                 'saya',
-                 'sedangkan',
-                 'pentingnya',
-                 'disebutkan',
-                 'bersama-sama',
-                 'dapat',
-                 'usah',
-                 'tambahnya',
-                 'masing-masing',
-                 'dituturkan',
-                 'merekalah',
-                 'semata-mata',
-                 'berikan',
-                 'minta',
-                 'kitalah',
-                 'keduanya',
-                 'guna',
-                 'lewat',
-                 'tanya',
-                 'dengan',
-                 'apakah',
-                 'jangan',
-                 'berkehendak',
-                 'bermacam-macam',
-                 'bilakah',
-                 'bagaikan',
-                 'didatangkan',
-                 'hingga',
-                 'bertutur',
-                 'memberi',
-                 'kami',
-                 'mula',
-                 'dibuatnya',
-                 'keluar',
-                 'dikira',
-                 'ditegaskan',
-                 'kamu',
-                 'sini',
-                 'perlunya',
-                 'pukul',
-                 'sedemikian',
-                 'berdatangan',
-                 'sajalah',
-                 'sesudah',
-                 'kelihatannya',
-                 'seolah',
-                 'aku',
-                 'telah',
-                 'mengetahui',
-                 'dimulai',
-                 'tersebutlah',
-                 'disinilah',
-                 'sekaranglah',
-                 'dimulainya',
-                 'keinginan',
-                 'sekalipun',
-                 'menegaskan',
-                 'menyatakan',
-                 'tambah',
-                 'menyampaikan',
-                 'enak',
-                 'masuk',
-                 'berlainan',
-                 'sebut',
-                 'dimaksudnya',
-                 'pihak',
-                 'sesuatu',
-                 'apa',
-                 'misalnya',
-                 'menanti-nanti',
-                 'tanyanya',
-                 'mempertanyakan',
-                 'anda',
-                 'dipergunakan',
-                 'next',
-                 'walau',
-                 'jelas',
-                 'sesekali',
-                 'adalah',
-                 'terjadilah',
-                 'diungkapkan',
-                 'akankah',
-                 'hendak',
-                 'ditunjuknya',
-                 'antaranya',
-                 'datang',
-                 'kalaulah',
-                 'sepertinya',
-                 'malah',
-                 'kemungkinan',
-                 'inikah',
-                 'menginginkan',
-                 'berjumlah',
-                 'berlangsung',
-                 'pastilah',
-                 'seingat',
-                 'setiba',
-                 'seberapa',
-                 'bersama',
-                 'nyata',
-                 'cukupkah',
-                 'sekecil',
-                 'lihat',
-                 'mempersiapkan',
-                 'ibu',
-                 'oleh',
-                 'memisalkan',
-                 'siapapun',
-                 'selaku',
-                 'katakanlah',
-                 'sama-sama',
-                 'penting',
-                 'memintakan',
-                 'bertanya',
-                 'mungkin',
-                 'menyeluruh',
-                 'diibaratkannya',
-                 'sebagian',
-                 'tak',
-                 'tandasnya',
-                 'lama',
-                 'kecil',
-                 'belum',
-                 'berikut',
-                 'lanjutnya',
-                 'justru',
-                 'kadar',
-                 'sekiranya',
-                 'selalu',
-                 'padanya',
-                 'semisalnya',
-                 'maksud',
-                 'mengatakannya',
-                 'entahlah',
-                 'lah',
-                 'sekadar',
-                 'mereka',
-                 'sebenarnya',
-                 'dirinya',
-                 'benar',
-                 'bekerja',
-                 'bagaimanakah',
-                 'menunjuk',
-                 'sebagaimana',
-                 'berada',
-                 'atau',
-                 'berbagai',
-                 'sebisanya',
-                 'memastikan',
-                 'ataupun',
-                 'pertanyaan',
-                 'sedikit',
-                 'sinilah',
-                 'berawal',
-                 'manakala',
-                 'paticle',
-                 'se',
-                 'ikut',
-                 'banyak',
-                 'nanti',
-                 'waduh',
-                 'orang',
-                 'meski',
-                 'dijelaskannya',
-                 'menyebutkan',
-                 'beginian',
-                 'itu',
-                 'teringat-ingat',
-                 'sendirinya',
-                 'caranya',
-                 'menghendaki',
-                 'dilakukan',
-                 'adanya',
-                 'sebesar',
-                 'masihkah',
-                 'tandas',
-                 'enggaknya',
-                 'empat',
-                 'memperkirakan',
-                 'yakni',
-                 'terdahulu',
-                 'artinya',
-                 'diibaratkan',
-                 'antara',
-                 'dan',
-                 'terdapat',
-                 'ditanyakan',
-                 'seolah-olah',
-                 'terutama',
-                 'lanjut',
-                 'pertanyakan',
-                 'sambil',
-                 'mendapat',
-                 'pak',
-                 'kiranya',
-                 'menanyai',
-                 'tempat',
-                 'cukup',
-                 'untuk',
-                 'inilah',
-                 'waktu',
-                 'kamilah',
-                 'terhadapnya',
-                 'sudahkah',
-                 'semaunya',
-                 'didapat',
-                 'tentu',
-                 'begitupun',
-                 'tampaknya',
-                 'dong',
-                 'hari',
-                 'soalnya',
-                 'mengibaratkannya',
-                 'terus',
-                 'menurut',
-                 'cuma',
-                 'menggunakan',
-                 'jelasnya',
-                 'segera',
-                 'malahan',
-                 'mau',
-                 'bermacam',
-                 'diingat',
-                 'seperti',
-                 'kira-kira',
-                 'semisal',
-                 'ibaratkan',
-                 'tanyakan',
-                 'belakangan',
-                 'selama-lamanya',
-                 'mata',
-                 'sangatlah',
-                 'sampai',
-                 'bagian',
-                 'ternyata',
-                 'semasa',
-                 'pun',
-                 'setidaknya',
-                 'langsung',
-                 'awalnya',
-                 'seluruhnya',
-                 'termasuk',
-                 'tiap',
-                 'diperlukannya',
-                 'buat',
-                 'berikutnya',
-                 'tahun',
-                 'diri',
-                 'cara',
-                 'entah',
-                 'mampukah',
-                 'tentulah',
-                 'mendatang',
-                 'kenapa',
-                 'nantinya',
-                 'kalaupun',
-                 'tahu',
-                 'secara',
-                 'ditandaskan',
-                 'kalian',
-                 'pertama',
-                 'benarkah',
-                 'punya',
-                 'segala',
-                 'dini',
-                 'katanya',
-                 'sebutlah',
-                 'beginikah',
-                 'saatnya',
-                 'dibuat',
-                 'kapan',
-                 'terkira',
-                 'lamanya',
-                 'memerlukan',
-                 'bahwasanya',
-                 'kok',
-                 'atas',
-                 'semuanya',
-                 'siap',
-                 'harus',
-                 'toh',
-                 'kerja',
-                 'bukannya',
-                 'juga',
-                 'setiap',
-                 'keterlaluan',
-                 'seketika',
-                 'diperlihatkan',
-                 'akan',
-                 'para',
-                 'mengibaratkan',
-                 'sangkut',
-                 'meyakini',
-                 'ditunjukkannya',
-                 'berupa',
-                 'mempersoalkan',
-                 'dilalui',
-                 'tersampaikan',
-                 'sesudahnya',
-                 'bisakah',
-                 'hanya',
-                 'melihatnya',
-                 'enggak',
-                 'apalagi',
-                 'kini',
-                 'mengucapkannya',
-                 'menanyakan',
-                 'bahkan',
-                 'begini',
-                 'melalui',
-                 'sekitar',
-                 'diakhirinya',
-                 'seringnya',
-                 'rata',
-                 'menunjukkan',
-                 'setengah',
-                 'pro',
-                 'naik',
-                 'membuat',
-                 'sejauh',
-                 'sekadarnya',
-                 'dipersoalkan',
-                 'mengatakan',
-                 'macam',
-                 'soal',
-                 'mulailah',
-                 'maupun',
-                 'dipunyai',
-                 'bolehkah',
-                 'inginkan',
-                 'ataukah',
-                 'sela',
-                 'inginkah',
-                 'diingatkan',
-                 'tentunya',
-                 'itukah',
-                 'semata',
-                 'sering',
-                 'mendapatkan',
-                 'menanya',
-                 'tepat',
-                 'menunjuknya',
-                 'menuturkan',
-                 'sendiri',
-                 'kan',
-                 'kebetulan',
-                 'amat',
-                 'jangankan',
-                 'tegas',
-                 'tinggi',
-                 'dahulu',
-                 'ke',
-                 'dijelaskan',
-                 'bulan',
-                 'yang',
-                 'terdiri',
-                 'lagian',
-                 'ketika',
-                 'kita',
-                 'sesuatunya',
-                 'sekurangnya',
-                 'itulah',
-                 'tegasnya',
-                 'kembali',
-                 'kemudian',
-                 'memberikan',
-                 'baik',
-                 'akhir',
-                 'keadaan',
-                 'bahwa',
-                 'rasa',
-                 'menambahkan',
-                 'belumlah',
-                 'boleh',
-                 'berakhirlah',
-                 'perlu',
-                 'tunjuk',
-                 'tapi',
-                 'berturut',
-                 'menjadi',
-                 'ibarat',
-                 'dituturkannya',
-                 'mulai',
-                 'berapalah',
-                 'melakukan',
-                 'di',
-                 'terjadi',
-                 'berapakah',
-                 'jumlahnya',
-                 'olehnya',
-                 'sebab',
-                 'diberikannya',
-                 'sebelum',
-                 'diminta',
-                 'sebaik-baiknya',
-                 'percuma',
-                 'numeral',
-                 'dipertanyakan',
-                 'khususnya',
-                 'tengah',
-                 'sebuah',
-                 'memperbuat',
-                 'ditunjuki',
-                 'tampak',
-                 'sejumlah',
-                 'diantara',
-                 'dipastikan',
-                 'menjelaskan',
-                 'lalu',
-                 'hampir',
-                 'pada',
-                 'sempat',
-                 'baru',
-                 'tertentu',
-                 'jadi',
-                 'bagai',
-                 'menunjuki',
-                 'manalagi',
-                 'sebagai',
-                 'mengingatkan',
-                 'diperbuatnya',
-                 'katakan',
-                 'menjawab',
-                 'karena',
-                 'dimungkinkan',
-                 'bagainamakah',
-                 'suatu',
-                 'begitu',
-                 'dikerjakan',
-                 'memungkinkan',
-                 'mungkinkah',
-                 'sebaik',
-                 'rupa',
-                 'keseluruhannya',
-                 'dimaksudkannya',
-                 'sedang',
-                 'berarti',
-                 'awal',
-                 'sehingga',
-                 'tuju',
-                 'sepantasnyalah',
-                 'seharusnya',
-                 'bagaimanapun',
-                 'diperkirakan',
-                 'terlihat',
-                 'cukuplah',
-                 'tidakkah',
-                 'misalkan',
-                 'begitulah',
-                 'dilihat',
-                 'biasa',
-                 'tetapi',
-                 'akhiri',
-                 'berapa',
-                 'menaiki',
-                 'memang',
-                 'mana',
-                 'masalahnya',
-                 'ungkap',
-                 'tutur',
-                 'terlebih',
-                 'memihak',
-                 'dimaksud',
-                 'disampaikan',
-                 'sekitarnya',
-                 'ujar',
-                 'makin',
-                 'berlalu',
-                 'bahwasannya',
-                 'semula',
-                 'meyakinkan',
-                 'berakhirnya',
-                 'sendirian',
-                 'dua',
-                 'daripada',
-                 'sebetulnya',
-                 'ditujukan',
-                 'hendaknya',
-                 'menuju',
-                 'menantikan',
-                 'antar',
-                 'diantaranya',
-                 'bermula',
-                 'ibaratnya',
-                 'bermaksud',
-                 'rasanya',
-                 'tiga',
-                 'setidak-tidaknya',
-                 'lebih',
-                 'tanpa',
-                 'kinilah',
-                 'demikianlah',
-                 'persoalan',
-                 'terjadinya',
-                 'bila',
-                 'agak',
-                 'semampu',
-                 'agar',
-                 'sesama',
-                 'bawah',
-                 'benarlah',
-                 'rupanya',
-                 'diperlukan',
-                 'bakalan',
-                 'terhadap',
-                 'berujar',
-                 'demi',
-                 'kasus',
-                 'semampunya',
-                 'seusai',
-                 'ia',
-                 'disini',
-                 'pihaknya',
-                 'kapankah',
-                 'saling',
-                 'kedua',
-                 'sekali',
-                 'balik',
-                 'sama',
-                 'diperbuat',
-                 'maka',
-                 'diberikan',
-                 'mempunyai',
-                 'diucapkan',
-                 'belakang',
-                 'sampaikan',
-                 'betulkah',
-                 'bagi',
-                 'ingat',
-                 'sepantasnya',
-                 'ditambahkan',
-                 'semacam',
-                 'yakin',
-                 'merasa',
-                 'mendatangkan',
-                 'ingat-ingat',
-                 'dimaksudkan',
-                 'nyatanya',
-                 'memulai',
-                 'disebut',
-                 'umumnya',
-                 'tertuju',
-                 'merupakan',
-                 'sebaliknya',
-                 'hanyalah',
-                 'dari',
-                 'mempergunakan',
-                 'adjectice',
-                 'kelihatan',
-                 'ujarnya',
-                 'namun',
-                 'sesampai',
-                 'jawab',
-                 'terakhir',
-                 'nyaris',
-                 'kala',
-                 'terlalu',
-                 'sangat',
-                 'kali',
-                 'ucap',
-                 'tadinya',
-                 'jauh',
-                 'setelah',
-                 'selain',
-                 'sekalian',
-                 'mengungkapkan',
-                 'sebutnya',
-                 'hal',
-                 'teringat',
-                 'demikian',
-                 'akhirnya',
-                 'perlukah',
-                 'agaknya',
-                 'ada',
-                 'andalah',
-                 'adapun',
-                 'laku',
-                 'jumlah',
-                 'jikalau',
-                 'pernah',
-                 'tuturnya',
-                 'sebelumnya',
-                 'panjang',
-                 'siapakah',
-                 'mengira',
-                 'sekarang',
-                 'mengenai',
-                 'ungkapnya',
-                 'bukanlah',
-                 'masih',
-                 'janganlah',
-                 'kelima',
-                 'melihat',
-                 'kira',
-                 'mendatangi',
-                 'jadinya',
-                 'bertanya-tanya',
-                 'bukan',
-                 'jika',
-                 'continue',
-                 'sebaiknya',
-                 'mirip',
-                 'sebegini',
-                 'page',
-                 'berkali-kali',
-                 'sesegera',
-                 'tetap',
-                 'melainkan',
-                 'pertama-tama',
-                 'supaya',
-                 'segalanya',
-                 'masing',
-                 'sudahlah',
-                 'sebabnya',
-                 'apabila',
-                 'semua',
-                 'menanti',
-                 'dekat',
-                 'lima',
-                 'sejenak',
-                 'jawabnya',
-                 'ditanya',
-                 'saat',
-                 'sudah',
-                 'walaupun',
-                 'sementara',
-                 'jelaslah',
-                 'mampu',
-                 'ditanyai',
-                 'terasa',
-                 'usai',
-                 'lainnya',
-                 'mengucapkan',
-                 'padahal',
-                 'pasti',
-                 'wong',
-                 'kelamaan',
-                 'asal',
-                 'tidak',
-                 'luar',
-                 'dimintai',
-                 'sampai-sampai',
-                 'beberapa',
-                 'menyiapkan',
-                 'kurang',
-                 'digunakan',
-                 'jelaskan',
-                 'begitukah',
-                 'bakal',
-                 'dikatakan',
-                 'jawaban',
-                 'bisa',
-                 'yaitu',
-                 'sebegitu',
-                 'wahai',
-                 'seperlunya',
-                 'masalah',
-                 'tadi',
-                 'kemungkinannya',
-                 'besar',
-                 'disebutkannya',
-                 'menandaskan',
-                 'tidaklah',
-                 'wah',
-                 'dalam',
-                 'jadilah',
-                 'lagi',
-                 'bolehlah',
-                 'berakhir',
-                 'memperlihatkan',
-                 'berapapun',
-                 'dulu',
-                 'diketahuinya',
-                 'berkata',
-                 'akulah',
-                 'ditunjuk',
-                 'arti',
-                 'berturut-turut',
-                 'beri',
-                 'saja',
-                 'mengingat',
-                 'masa',
-                 'satu',
-                 'pula',
-                 'bersiap-siap',
-                 'bukankah',
-                 'mengakhiri',
-                 'tentang',
-                 'kalau',
-                 'sewaktu',
-                 'seorang',
-                 'semasih',
-                 'kepadanya',
-                 'mengerjakan',
-                 'paling',
-                 'pantas',
-                 'diinginkan',
-                 'ditunjukkan',
-                 'ini',
-                 'dialah',
-                 'dimulailah',
-                 'seenaknya',
-                 'berkeinginan',
-                 'diakhiri',
-                 'keseluruhan',
-                 'selanjutnya',
-                 'serupa',
-                 'nah',
-                 'setinggi',
-                 'meskipun',
-                 'betul',
-                 'berkenaan',
-                 'bersiap',
-                 'seterusnya',
-                 'mulanya',
-                 'dikatakannya',
-                 'harusnya',
-                 'waktunya',
-                 'bapak',
-                 'dijawab',
-                 'diucapkannya',
-                 'apaan',
-                 'apatah',
-                 'kena',
-                 'serta',
-                 'beginilah',
-                 'khusus',
-                 'terbanyak',
-                 'asalkan',
-                 'sayalah',
-                 'selama',
-                 'sepanjang',
-                 'sepihak',
-                 'hadap',
-                 'ucapnya',
-                 'misal',
-                 'berlebihan']
+        return list(STOP_WORD_LIST)
+    
+    def stemmed_stop_words(self):
+        """ Set of the stems of the stop words, for filtering after stemming """
+        if self.stem_derivational:
+            return STEMMED_STOP_WORDS
+        return frozenset(self._stem(w) for w in STOP_WORD_LIST)
+    
+    def stem_filtered(self, words, before=True, after=False):
+        """
+        Stream the stems of words, dropping stop words before stemming
+        (the surface form is a stop word) and/or after stemming (the stem
+        is the stem of a stop word)
+        """
+        stemmed_stop_words = self.stemmed_stop_words() if after else ()
+        for word in words:
+            if before and word in STOP_WORDS:
+                continue
+            stem = self.stem(word)
+            if stem in stemmed_stop_words:
+                continue
+            yield stem
+
+
+# Indonesian stop words, from the same source as the stemming rules
+STOP_WORD_LIST = (
+    'tiba-tiba',
+    'kepada',
+    'mengapa',
+    'haruslah',
+    'secukupnya',
+    'sekaligus',
+    'tiba',
+    'per',
+    'kata',
+    'kesampaian',
+    'sedikitnya',
+    'sejak',
+    'kamulah',
+    'dikarenakan',
+    'to',
+    'setibanya',
+    'setempat',
+    'ialah',
+    'turut',
+    'sekali-kali',
+    'seluruh',
+    'utama',
+    'sesaat',
+    'hendaklah',
+    'ingin',
+    'depan',
+    'sebanyak',
+    'siapa',
+    'lain',
+    'tersebut',
+    'diketahui',
+    'dimisalkan',
+    'meminta',
+    'sekurang-kurangnya',
+    'kapanpun',
+    'amatlah',
+    'semakin',
+    'selamanya',
+    'dia',
+    'seseorang',
+    'bagaimana',
+    'gunakan',
+    'sana',
+    'sebagainya',
+    'menyangkut',
+    'makanya',
+    'karenanya',
+    'umum',
+    'bung',
+    'diberi',
+    'biasanya',
+    'saya',
+    'sedangkan',
+    'pentingnya',
+    'disebutkan',
+    'bersama-sama',
+    'dapat',
+    'usah',
+    'tambahnya',
+    'masing-masing',
+    'dituturkan',
+    'merekalah',
+    'semata-mata',
+    'berikan',
+    'minta',
+    'kitalah',
+    'keduanya',
+    'guna',
+    'lewat',
+    'tanya',
+    'dengan',
+    'apakah',
+    'jangan',
+    'berkehendak',
+    'bermacam-macam',
+    'bilakah',
+    'bagaikan',
+    'didatangkan',
+    'hingga',
+    'bertutur',
+    'memberi',
+    'kami',
+    'mula',
+    'dibuatnya',
+    'keluar',
+    'dikira',
+    'ditegaskan',
+    'kamu',
+    'sini',
+    'perlunya',
+    'pukul',
+    'sedemikian',
+    'berdatangan',
+    'sajalah',
+    'sesudah',
+    'kelihatannya',
+    'seolah',
+    'aku',
+    'telah',
+    'mengetahui',
+    'dimulai',
+    'tersebutlah',
+    'disinilah',
+    'sekaranglah',
+    'dimulainya',
+    'keinginan',
+    'sekalipun',
+    'menegaskan',
+    'menyatakan',
+    'tambah',
+    'menyampaikan',
+    'enak',
+    'masuk',
+    'berlainan',
+    'sebut',
+    'dimaksudnya',
+    'pihak',
+    'sesuatu',
+    'apa',
+    'misalnya',
+    'menanti-nanti',
+    'tanyanya',
+    'mempertanyakan',
+    'anda',
+    'dipergunakan',
+    'next',
+    'walau',
+    'jelas',
+    'sesekali',
+    'adalah',
+    'terjadilah',
+    'diungkapkan',
+    'akankah',
+    'hendak',
+    'ditunjuknya',
+    'antaranya',
+    'datang',
+    'kalaulah',
+    'sepertinya',
+    'malah',
+    'kemungkinan',
+    'inikah',
+    'menginginkan',
+    'berjumlah',
+    'berlangsung',
+    'pastilah',
+    'seingat',
+    'setiba',
+    'seberapa',
+    'bersama',
+    'nyata',
+    'cukupkah',
+    'sekecil',
+    'lihat',
+    'mempersiapkan',
+    'ibu',
+    'oleh',
+    'memisalkan',
+    'siapapun',
+    'selaku',
+    'katakanlah',
+    'sama-sama',
+    'penting',
+    'memintakan',
+    'bertanya',
+    'mungkin',
+    'menyeluruh',
+    'diibaratkannya',
+    'sebagian',
+    'tak',
+    'tandasnya',
+    'lama',
+    'kecil',
+    'belum',
+    'berikut',
+    'lanjutnya',
+    'justru',
+    'kadar',
+    'sekiranya',
+    'selalu',
+    'padanya',
+    'semisalnya',
+    'maksud',
+    'mengatakannya',
+    'entahlah',
+    'lah',
+    'sekadar',
+    'mereka',
+    'sebenarnya',
+    'dirinya',
+    'benar',
+    'bekerja',
+    'bagaimanakah',
+    'menunjuk',
+    'sebagaimana',
+    'berada',
+    'atau',
+    'berbagai',
+    'sebisanya',
+    'memastikan',
+    'ataupun',
+    'pertanyaan',
+    'sedikit',
+    'sinilah',
+    'berawal',
+    'manakala',
+    'paticle',
+    'se',
+    'ikut',
+    'banyak',
+    'nanti',
+    'waduh',
+    'orang',
+    'meski',
+    'dijelaskannya',
+    'menyebutkan',
+    'beginian',
+    'itu',
+    'teringat-ingat',
+    'sendirinya',
+    'caranya',
+    'menghendaki',
+    'dilakukan',
+    'adanya',
+    'sebesar',
+    'masihkah',
+    'tandas',
+    'enggaknya',
+    'empat',
+    'memperkirakan',
+    'yakni',
+    'terdahulu',
+    'artinya',
+    'diibaratkan',
+    'antara',
+    'dan',
+    'terdapat',
+    'ditanyakan',
+    'seolah-olah',
+    'terutama',
+    'lanjut',
+    'pertanyakan',
+    'sambil',
+    'mendapat',
+    'pak',
+    'kiranya',
+    'menanyai',
+    'tempat',
+    'cukup',
+    'untuk',
+    'inilah',
+    'waktu',
+    'kamilah',
+    'terhadapnya',
+    'sudahkah',
+    'semaunya',
+    'didapat',
+    'tentu',
+    'begitupun',
+    'tampaknya',
+    'dong',
+    'hari',
+    'soalnya',
+    'mengibaratkannya',
+    'terus',
+    'menurut',
+    'cuma',
+    'menggunakan',
+    'jelasnya',
+    'segera',
+    'malahan',
+    'mau',
+    'bermacam',
+    'diingat',
+    'seperti',
+    'kira-kira',
+    'semisal',
+    'ibaratkan',
+    'tanyakan',
+    'belakangan',
+    'selama-lamanya',
+    'mata',
+    'sangatlah',
+    'sampai',
+    'bagian',
+    'ternyata',
+    'semasa',
+    'pun',
+    'setidaknya',
+    'langsung',
+    'awalnya',
+    'seluruhnya',
+    'termasuk',
+    'tiap',
+    'diperlukannya',
+    'buat',
+    'berikutnya',
+    'tahun',
+    'diri',
+    'cara',
+    'entah',
+    'mampukah',
+    'tentulah',
+    'mendatang',
+    'kenapa',
+    'nantinya',
+    'kalaupun',
+    'tahu',
+    'secara',
+    'ditandaskan',
+    'kalian',
+    'pertama',
+    'benarkah',
+    'punya',
+    'segala',
+    'dini',
+    'katanya',
+    'sebutlah',
+    'beginikah',
+    'saatnya',
+    'dibuat',
+    'kapan',
+    'terkira',
+    'lamanya',
+    'memerlukan',
+    'bahwasanya',
+    'kok',
+    'atas',
+    'semuanya',
+    'siap',
+    'harus',
+    'toh',
+    'kerja',
+    'bukannya',
+    'juga',
+    'setiap',
+    'keterlaluan',
+    'seketika',
+    'diperlihatkan',
+    'akan',
+    'para',
+    'mengibaratkan',
+    'sangkut',
+    'meyakini',
+    'ditunjukkannya',
+    'berupa',
+    'mempersoalkan',
+    'dilalui',
+    'tersampaikan',
+    'sesudahnya',
+    'bisakah',
+    'hanya',
+    'melihatnya',
+    'enggak',
+    'apalagi',
+    'kini',
+    'mengucapkannya',
+    'menanyakan',
+    'bahkan',
+    'begini',
+    'melalui',
+    'sekitar',
+    'diakhirinya',
+    'seringnya',
+    'rata',
+    'menunjukkan',
+    'setengah',
+    'pro',
+    'naik',
+    'membuat',
+    'sejauh',
+    'sekadarnya',
+    'dipersoalkan',
+    'mengatakan',
+    'macam',
+    'soal',
+    'mulailah',
+    'maupun',
+    'dipunyai',
+    'bolehkah',
+    'inginkan',
+    'ataukah',
+    'sela',
+    'inginkah',
+    'diingatkan',
+    'tentunya',
+    'itukah',
+    'semata',
+    'sering',
+    'mendapatkan',
+    'menanya',
+    'tepat',
+    'menunjuknya',
+    'menuturkan',
+    'sendiri',
+    'kan',
+    'kebetulan',
+    'amat',
+    'jangankan',
+    'tegas',
+    'tinggi',
+    'dahulu',
+    'ke',
+    'dijelaskan',
+    'bulan',
+    'yang',
+    'terdiri',
+    'lagian',
+    'ketika',
+    'kita',
+    'sesuatunya',
+    'sekurangnya',
+    'itulah',
+    'tegasnya',
+    'kembali',
+    'kemudian',
+    'memberikan',
+    'baik',
+    'akhir',
+    'keadaan',
+    'bahwa',
+    'rasa',
+    'menambahkan',
+    'belumlah',
+    'boleh',
+    'berakhirlah',
+    'perlu',
+    'tunjuk',
+    'tapi',
+    'berturut',
+    'menjadi',
+    'ibarat',
+    'dituturkannya',
+    'mulai',
+    'berapalah',
+    'melakukan',
+    'di',
+    'terjadi',
+    'berapakah',
+    'jumlahnya',
+    'olehnya',
+    'sebab',
+    'diberikannya',
+    'sebelum',
+    'diminta',
+    'sebaik-baiknya',
+    'percuma',
+    'numeral',
+    'dipertanyakan',
+    'khususnya',
+    'tengah',
+    'sebuah',
+    'memperbuat',
+    'ditunjuki',
+    'tampak',
+    'sejumlah',
+    'diantara',
+    'dipastikan',
+    'menjelaskan',
+    'lalu',
+    'hampir',
+    'pada',
+    'sempat',
+    'baru',
+    'tertentu',
+    'jadi',
+    'bagai',
+    'menunjuki',
+    'manalagi',
+    'sebagai',
+    'mengingatkan',
+    'diperbuatnya',
+    'katakan',
+    'menjawab',
+    'karena',
+    'dimungkinkan',
+    'bagainamakah',
+    'suatu',
+    'begitu',
+    'dikerjakan',
+    'memungkinkan',
+    'mungkinkah',
+    'sebaik',
+    'rupa',
+    'keseluruhannya',
+    'dimaksudkannya',
+    'sedang',
+    'berarti',
+    'awal',
+    'sehingga',
+    'tuju',
+    'sepantasnyalah',
+    'seharusnya',
+    'bagaimanapun',
+    'diperkirakan',
+    'terlihat',
+    'cukuplah',
+    'tidakkah',
+    'misalkan',
+    'begitulah',
+    'dilihat',
+    'biasa',
+    'tetapi',
+    'akhiri',
+    'berapa',
+    'menaiki',
+    'memang',
+    'mana',
+    'masalahnya',
+    'ungkap',
+    'tutur',
+    'terlebih',
+    'memihak',
+    'dimaksud',
+    'disampaikan',
+    'sekitarnya',
+    'ujar',
+    'makin',
+    'berlalu',
+    'bahwasannya',
+    'semula',
+    'meyakinkan',
+    'berakhirnya',
+    'sendirian',
+    'dua',
+    'daripada',
+    'sebetulnya',
+    'ditujukan',
+    'hendaknya',
+    'menuju',
+    'menantikan',
+    'antar',
+    'diantaranya',
+    'bermula',
+    'ibaratnya',
+    'bermaksud',
+    'rasanya',
+    'tiga',
+    'setidak-tidaknya',
+    'lebih',
+    'tanpa',
+    'kinilah',
+    'demikianlah',
+    'persoalan',
+    'terjadinya',
+    'bila',
+    'agak',
+    'semampu',
+    'agar',
+    'sesama',
+    'bawah',
+    'benarlah',
+    'rupanya',
+    'diperlukan',
+    'bakalan',
+    'terhadap',
+    'berujar',
+    'demi',
+    'kasus',
+    'semampunya',
+    'seusai',
+    'ia',
+    'disini',
+    'pihaknya',
+    'kapankah',
+    'saling',
+    'kedua',
+    'sekali',
+    'balik',
+    'sama',
+    'diperbuat',
+    'maka',
+    'diberikan',
+    'mempunyai',
+    'diucapkan',
+    'belakang',
+    'sampaikan',
+    'betulkah',
+    'bagi',
+    'ingat',
+    'sepantasnya',
+    'ditambahkan',
+    'semacam',
+    'yakin',
+    'merasa',
+    'mendatangkan',
+    'ingat-ingat',
+    'dimaksudkan',
+    'nyatanya',
+    'memulai',
+    'disebut',
+    'umumnya',
+    'tertuju',
+    'merupakan',
+    'sebaliknya',
+    'hanyalah',
+    'dari',
+    'mempergunakan',
+    'adjectice',
+    'kelihatan',
+    'ujarnya',
+    'namun',
+    'sesampai',
+    'jawab',
+    'terakhir',
+    'nyaris',
+    'kala',
+    'terlalu',
+    'sangat',
+    'kali',
+    'ucap',
+    'tadinya',
+    'jauh',
+    'setelah',
+    'selain',
+    'sekalian',
+    'mengungkapkan',
+    'sebutnya',
+    'hal',
+    'teringat',
+    'demikian',
+    'akhirnya',
+    'perlukah',
+    'agaknya',
+    'ada',
+    'andalah',
+    'adapun',
+    'laku',
+    'jumlah',
+    'jikalau',
+    'pernah',
+    'tuturnya',
+    'sebelumnya',
+    'panjang',
+    'siapakah',
+    'mengira',
+    'sekarang',
+    'mengenai',
+    'ungkapnya',
+    'bukanlah',
+    'masih',
+    'janganlah',
+    'kelima',
+    'melihat',
+    'kira',
+    'mendatangi',
+    'jadinya',
+    'bertanya-tanya',
+    'bukan',
+    'jika',
+    'continue',
+    'sebaiknya',
+    'mirip',
+    'sebegini',
+    'page',
+    'berkali-kali',
+    'sesegera',
+    'tetap',
+    'melainkan',
+    'pertama-tama',
+    'supaya',
+    'segalanya',
+    'masing',
+    'sudahlah',
+    'sebabnya',
+    'apabila',
+    'semua',
+    'menanti',
+    'dekat',
+    'lima',
+    'sejenak',
+    'jawabnya',
+    'ditanya',
+    'saat',
+    'sudah',
+    'walaupun',
+    'sementara',
+    'jelaslah',
+    'mampu',
+    'ditanyai',
+    'terasa',
+    'usai',
+    'lainnya',
+    'mengucapkan',
+    'padahal',
+    'pasti',
+    'wong',
+    'kelamaan',
+    'asal',
+    'tidak',
+    'luar',
+    'dimintai',
+    'sampai-sampai',
+    'beberapa',
+    'menyiapkan',
+    'kurang',
+    'digunakan',
+    'jelaskan',
+    'begitukah',
+    'bakal',
+    'dikatakan',
+    'jawaban',
+    'bisa',
+    'yaitu',
+    'sebegitu',
+    'wahai',
+    'seperlunya',
+    'masalah',
+    'tadi',
+    'kemungkinannya',
+    'besar',
+    'disebutkannya',
+    'menandaskan',
+    'tidaklah',
+    'wah',
+    'dalam',
+    'jadilah',
+    'lagi',
+    'bolehlah',
+    'berakhir',
+    'memperlihatkan',
+    'berapapun',
+    'dulu',
+    'diketahuinya',
+    'berkata',
+    'akulah',
+    'ditunjuk',
+    'arti',
+    'berturut-turut',
+    'beri',
+    'saja',
+    'mengingat',
+    'masa',
+    'satu',
+    'pula',
+    'bersiap-siap',
+    'bukankah',
+    'mengakhiri',
+    'tentang',
+    'kalau',
+    'sewaktu',
+    'seorang',
+    'semasih',
+    'kepadanya',
+    'mengerjakan',
+    'paling',
+    'pantas',
+    'diinginkan',
+    'ditunjukkan',
+    'ini',
+    'dialah',
+    'dimulailah',
+    'seenaknya',
+    'berkeinginan',
+    'diakhiri',
+    'keseluruhan',
+    'selanjutnya',
+    'serupa',
+    'nah',
+    'setinggi',
+    'meskipun',
+    'betul',
+    'berkenaan',
+    'bersiap',
+    'seterusnya',
+    'mulanya',
+    'dikatakannya',
+    'harusnya',
+    'waktunya',
+    'bapak',
+    'dijawab',
+    'diucapkannya',
+    'apaan',
+    'apatah',
+    'kena',
+    'serta',
+    'beginilah',
+    'khusus',
+    'terbanyak',
+    'asalkan',
+    'sayalah',
+    'selama',
+    'sepanjang',
+    'sepihak',
+    'hadap',
+    'ucapnya',
+    'misal',
+    'berlebihan',
+)
+
+STOP_WORDS = frozenset(STOP_WORD_LIST)
+
+STEMMED_STOP_WORDS = frozenset(stem_word(w) for w in STOP_WORD_LIST)
+
 
 if __name__ == "__main__":
     stemmer = IndonesianStemmer()
@@ -1045,4 +1271,55 @@ if __name__ == "__main__":
     assert stemmer.stem(u'permainan') == u'main'
     assert stemmer.stem(u'kemenangan') == u'menang'
     assert stemmer.stem(u'berjatuhan') == u'jatuh'
-    assert stemmer.stem(u'mengambili') == u'ambil'
\ No newline at end of file
+    assert stemmer.stem(u'mengambili') == u'ambil'
+    
+    cached = IndonesianStemmer(cache_size=2)
+    assert cached.stem(u'makanan') == u'makan'
+    assert cached.stem(u'makanan') == u'makan'
+    cached.stem(u'berlari')
+    cached.stem(u'dimakan')
+    info = cached.cache_info()
+    assert (info['hits'], info['misses'], info['evictions']) == (1, 3, 1)
+    assert u'makanan' not in cached.cache
+    cached.clear_cache()
+    assert cached.cache_info()['size'] == 0
+    
+    words = [u'makanan', u'dimakan', u'makanan', u'berlari']
+    forms, stems, index = stemmer.stem_tokens(words)
+    assert forms == [u'makanan', u'dimakan', u'berlari']
+    assert stems == [u'makan', u'makan', u'lari']
+    assert list(index) == [0, 1, 0, 2]
+    assert stemmer.stem_many(iter(words)) == [stemmer.stem(w) for w in words]
+    
+    from concurrent.futures import ThreadPoolExecutor
+    shared = IndonesianStemmer(cache_size=8)
+    batch = [u'mengambil', u'pengatur', u'kemenangan', u'berjatuhan'] * 500
+    with ThreadPoolExecutor(8) as pool:
+        assert list(pool.map(shared.stem, batch)) == \
+            [stem_word(w) for w in batch]
+    
+    # compiled rule tables against the reference cascade
+    prefixes = [u'', u'meng', u'meny', u'men', u'mem', u'me', u'peng',
+                u'peny', u'pen', u'pem', u'pe', u'per', u'ber', u'be',
+                u'di', u'ter', u'ke', u'se']
+    roots = [u'ajar', u'elajar', u'lajar', u'ambil', u'atur', u'ubah',
+             u'kerja', u'sapu', u'tulis', u'nyanyi', u'opini', u'a', u'i',
+             u'ua', u'si', u'ekor', u'erti', u'rasa', u'ingat']
+    suffixes = [u'', u'kan', u'an', u'i', u'si', u'nya', u'ku', u'mu',
+                u'lah', u'kah', u'pun']
+    vocabulary = set(stemmer.stop_words())
+    vocabulary.update(p + r + s1 + s2 for p in prefixes for r in roots
+                      for s1 in suffixes for s2 in suffixes)
+    vocabulary.update([u'', u'belajar', u'pelajar', u'peny', u'menya'])
+    for w in vocabulary:
+        assert stem_word(w) == reference_stem_word(w), w
+        assert stem_word(w, False) == reference_stem_word(w, False), w
+    
+    assert stemmer.stop_words()[:2] == ['tiba-tiba', 'kepada']
+    assert len(stemmer.stop_words()) == len(STOP_WORD_LIST)
+    assert u'kepada' in STOP_WORDS
+    assert list(stemmer.stem_filtered([u'dia', u'berlari', u'kepada'])) == \
+        [u'lari']
+    assert list(stemmer.stem_filtered([u'diberikan', u'kemenangan'],
+                                      before=False, after=True)) == \
+        [u'menang']
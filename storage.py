@@ -0,0 +1,730 @@
+"""
+Persistent, memory mapped inverted index made of immutable segments
+
+A segment file holds, all integers little endian:
+
+    header     magic (8 bytes) | doc count u32 | term count u32 |
+               docs offset u64 | terms offset u64 | postings offset u64
+    docs       (doc count + 1) u32 offsets | utf-8 doc ids
+    terms      (term count + 1) u32 offsets |
+               term count x (postings offset u64, length u32, max weight f32)
+               | utf-8 terms, sorted bytewise
+    postings   per term: ceil(length / BLOCK) x (first doc u32, byte
+               offset u32) skip entries and the byte length u32 of all
+               blocks, the increasing document numbers as varint gaps in
+               blocks of BLOCK, each block starting from zero, then length
+               float32 weights
+
+Every append writes a new segment and the SEGMENTS manifest, listing the
+live segments in order, is replaced atomically. merge() rewrites all
+segments into one. Readers map segments read-only, so serving processes
+share them through the page cache with nothing to unpickle at startup.
+
+Segments never change once written. Deleted documents are recorded in
+segment-NNNNNN.GGGGGG.del files (sorted u32 document numbers), a new
+generation per change, and each manifest line names a segment and its
+current deletes file. A new segment and the deletes of the older copies
+it replaces are therefore published by the same manifest replace, so a
+crash or a reader never sees both copies live. Adding a document whose
+id is already live deletes the older copy, so a re-synced post replaces
+its previous version. Queries skip deleted documents, merge() drops them.
+
+Queries decode nothing up front: each posting list is read block by block
+as MaxScore reaches it, non-essential lists are probed through the skip
+entries, and score bounds come from the max weight in the term records.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from retrieval import maxscore_top_k, BOUND_SLACK
+
+
+MAGIC = b'IDXSEG02'
+MANIFEST = 'SEGMENTS'
+BLOCK = 128
+_HEADER = struct.Struct('<8sIIQQQ')
+_UINT = struct.Struct('<I')
+_FLOAT = struct.Struct('<f')
+_TERM = struct.Struct('<QIf')
+
+
+def encode_varints(numbers):
+    """ Encode increasing non-negative integers as varint gaps """
+    out = bytearray()
+    previous = 0
+    for number in numbers:
+        gap = number - previous
+        previous = number
+        while gap >= 0x80:
+            out.append((gap & 0x7f) | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+
+def decode_varints(data, count, start=0):
+    """ Decode count varint gaps from data[start:]. Returns (numbers, end) """
+    numbers = array('I')
+    value = 0
+    position = start
+    for _ in range(count):
+        gap = 0
+        shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            gap |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        value += gap
+        numbers.append(value)
+    return numbers, position
+
+
+def _uint_array(data):
+    numbers = array('I')
+    numbers.frombytes(data)
+    if sys.byteorder != 'little':
+        numbers.byteswap()
+    return numbers
+
+
+def _encode_postings(docs, weights):
+    skips = array('I')
+    blocks = []
+    offset = 0
+    for start in range(0, len(docs), BLOCK):
+        block = encode_varints(docs[start:start + BLOCK])
+        skips.append(docs[start])
+        skips.append(offset)
+        blocks.append(block)
+        offset += len(block)
+    skips.append(offset)
+    if sys.byteorder != 'little':
+        skips.byteswap()
+        weights = array('f', weights)
+        weights.byteswap()
+    return skips.tobytes() + b''.join(blocks) + weights.tobytes()
+
+
+def _pack_strings(strings):
+    blobs = [s.encode('utf-8') for s in strings]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return struct.pack('<%dI' % len(offsets), *offsets), b''.join(blobs)
+
+
+def write_segment(path, documents):
+    """
+    Write a segment from (doc_id, {term: weight}) pairs. Documents are
+    numbered in the given order; doc ids are stored as text
+    """
+    doc_ids = []
+    postings = {}
+    for doc_id, weights in documents:
+        doc = len(doc_ids)
+        doc_ids.append(str(doc_id))
+        for term, weight in weights.items():
+            if weight <= 0:
+                continue
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array('I'), array('f'))
+            entry[0].append(doc)
+            entry[1].append(weight)
+    _write(path, doc_ids, postings)
+    return len(doc_ids)
+
+
+def _write(path, doc_ids, postings):
+    terms = sorted(postings, key=lambda term: term.encode('utf-8'))
+
+    records = []
+    chunks = []
+    offset = 0
+    for term in terms:
+        docs, weights = postings[term]
+        records.append(_TERM.pack(offset, len(docs), max(weights)))
+        chunk = _encode_postings(docs, weights)
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    doc_offsets, doc_blob = _pack_strings(doc_ids)
+    term_offsets, term_blob = _pack_strings(terms)
+    docs_at = _HEADER.size
+    terms_at = docs_at + len(doc_offsets) + len(doc_blob)
+    postings_at = terms_at + len(term_offsets) + len(records) * _TERM.size \
+        + len(term_blob)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(doc_ids), len(terms),
+                             docs_at, terms_at, postings_at))
+        f.write(doc_offsets)
+        f.write(doc_blob)
+        f.write(term_offsets)
+        f.write(b''.join(records))
+        f.write(term_blob)
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+class PostingDocs(object):
+    """
+    Document numbers of one posting list, decoded a block at a time when
+    they are indexed. base is added to every number. seek() finds a
+    document through the skip entries, decoding a single block
+    """
+
+    def __init__(self, data, length, at, base=0):
+        self._data = data
+        self._length = length
+        blocks = (length + BLOCK - 1) // BLOCK
+        skips = _uint_array(data[at:at + blocks * 8 + 4])
+        self._firsts = skips[0:-1:2]
+        self._offsets = skips[1::2]
+        self._blocks_at = at + blocks * 8 + 4
+        # weights follow the last block
+        self.end = self._blocks_at + skips[-1]
+        self.base = base
+        # no block loaded yet: no position is >= length
+        self._block = -1
+        self._start = length
+        self._docs = None
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if not self._start <= i < self._start + BLOCK:
+            self._load(i // BLOCK)
+        return self._docs[i - self._start]
+
+    def _load(self, block):
+        start = block * BLOCK
+        docs, _ = decode_varints(self._data,
+                                 min(BLOCK, self._length - start),
+                                 self._blocks_at + self._offsets[block])
+        if self.base:
+            docs = array('I', [doc + self.base for doc in docs])
+        self._block = block
+        self._start = start
+        self._docs = docs
+
+    def seek(self, doc, lo):
+        """ First position >= lo holding a document >= doc """
+        if lo >= self._length:
+            return self._length
+        block = max(bisect_right(self._firsts, doc - self.base) - 1,
+                    lo // BLOCK)
+        if block != self._block:
+            self._load(block)
+        return self._start + bisect_left(self._docs, doc,
+                                         max(lo - self._start, 0))
+
+
+class PostingWeights(object):
+    """ Float32 weights of one posting list, read in place when indexed """
+
+    def __init__(self, data, length, at):
+        self._data = data
+        self._length = length
+        self._at = at
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        return _FLOAT.unpack_from(self._data, self._at + i * 4)[0]
+
+
+class Segment(object):
+    """ Read only, memory mapped view of one segment file """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.doc_count, self.term_count, docs_at, terms_at, \
+            self._postings_at = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError("%s is not an index segment" % path)
+        self._doc_offsets = docs_at
+        self._doc_blob = docs_at + (self.doc_count + 1) * _UINT.size
+        self._term_offsets = terms_at
+        self._term_records = terms_at + (self.term_count + 1) * _UINT.size
+        self._term_blob = self._term_records + self.term_count * _TERM.size
+        self.deletes_name = None
+        self.deleted = frozenset()
+
+    def __len__(self):
+        return self.doc_count
+
+    def load_deletes(self, name):
+        """ Read the deleted document numbers from the deletes file name """
+        deleted = frozenset()
+        if name is not None:
+            path = os.path.join(os.path.dirname(self.path), name)
+            with open(path, 'rb') as f:
+                deleted = frozenset(_uint_array(f.read()))
+        self.deletes_name = name
+        self.deleted = deleted
+
+    def _string(self, table, blob, i):
+        start, end = struct.unpack_from('<II', self._map, table + i * 4)
+        return self._map[blob + start:blob + end]
+
+    def doc_id(self, doc):
+        return self._string(self._doc_offsets, self._doc_blob, doc) \
+            .decode('utf-8')
+
+    def term(self, i):
+        return self._string(self._term_offsets, self._term_blob, i) \
+            .decode('utf-8')
+
+    def _find(self, term):
+        key = term.encode('utf-8')
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(self._term_offsets, self._term_blob, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and \
+           self._string(self._term_offsets, self._term_blob, lo) == key:
+            return lo
+        return -1
+
+    def _record(self, i):
+        return _TERM.unpack_from(self._map, self._term_records +
+                                 i * _TERM.size)
+
+    def _lazy(self, i, base=0):
+        offset, length, max_weight = self._record(i)
+        docs = PostingDocs(self._map, length, self._postings_at + offset, base)
+        return max_weight, docs, length
+
+    def _decode(self, i):
+        _, lazy, length = self._lazy(i)
+        docs = array('I')
+        for block in range(0, length, BLOCK):
+            lazy._load(block // BLOCK)
+            docs.extend(lazy._docs)
+        end = lazy.end
+        weights = array('f')
+        weights.frombytes(self._map[end:end + length * 4])
+        if sys.byteorder != 'little':
+            weights.byteswap()
+        return docs, weights
+
+    def postings(self, term):
+        """ (docs, weights) arrays of term, or None if it does not occur """
+        i = self._find(term)
+        if i < 0:
+            return None
+        return self._decode(i)
+
+    def posting_list(self, term, base=0):
+        """
+        (max weight, docs, weights) of term without decoding anything, docs
+        numbered from base, or None if it does not occur
+        """
+        i = self._find(term)
+        if i < 0:
+            return None
+        max_weight, docs, length = self._lazy(i, base)
+        return max_weight, docs, PostingWeights(self._map, length, docs.end)
+
+    def max_weight(self, term):
+        i = self._find(term)
+        return self._record(i)[2] if i >= 0 else 0.0
+
+    def items(self):
+        """ Yield (term, docs, weights) for every term, in term order """
+        for i in range(self.term_count):
+            docs, weights = self._decode(i)
+            yield self.term(i), docs, weights
+
+    def close(self):
+        self._map.close()
+
+
+class SegmentedIndex(object):
+    """
+    Directory of segments behind a SEGMENTS manifest. Documents of later
+    segments are numbered after those of earlier ones, deleted ones
+    included, until merge() renumbers them. A single process should write;
+    any number may read and call reload() to pick up new segments and
+    deletes
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.segments = []
+        self._live = None
+        self.reload()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        """ Number of live documents """
+        return sum(len(segment) - len(segment.deleted)
+                   for segment in self.segments)
+
+    def _read_manifest(self):
+        """ [(segment name, deletes name or None)] in document order """
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                lines = [line.split() for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        return [(line[0], line[1] if len(line) > 1 else None)
+                for line in lines]
+
+    def _write_manifest(self, entries):
+        manifest = os.path.join(self.path, MANIFEST)
+        with open(manifest + '.tmp', 'w') as f:
+            f.write(''.join(' '.join(name for name in entry if name) + '\n'
+                            for entry in entries))
+        os.replace(manifest + '.tmp', manifest)
+
+    def reload(self, attempts=3):
+        """
+        Map the segments currently listed in the manifest, with their
+        deletes. A file the writer removed between reading the manifest and
+        opening it means a newer manifest, which is read again
+        """
+        for attempt in range(attempts):
+            try:
+                self._open(self._read_manifest())
+                return
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+
+    def _open(self, entries):
+        opened = dict((os.path.basename(segment.path), segment)
+                      for segment in self.segments)
+        segments = []
+        try:
+            for name, deletes_name in entries:
+                segment = opened.pop(name, None)
+                if segment is None:
+                    segment = Segment(os.path.join(self.path, name))
+                segments.append(segment)
+                if segment.deletes_name != deletes_name:
+                    segment.load_deletes(deletes_name)
+        except BaseException:
+            for segment in segments:
+                if segment not in self.segments:
+                    segment.close()
+            raise
+        for segment in opened.values():
+            segment.close()
+        self.segments = segments
+        self._live = None
+
+    def _next_name(self):
+        numbers = [int(name[8:14]) for name in os.listdir(self.path)
+                   if name.startswith('segment-') and name.endswith('.idx')]
+        return 'segment-%06d.idx' % (max(numbers) + 1 if numbers else 1)
+
+    def _next_deletes_name(self, name):
+        prefix = name[:-len('.idx')] + '.'
+        generations = [int(other[len(prefix):-len('.del')])
+                       for other in os.listdir(self.path)
+                       if other.startswith(prefix) and other.endswith('.del')]
+        return '%s%06d.del' % (prefix, max(generations) + 1
+                               if generations else 1)
+
+    def _with_deletes(self, doc_ids):
+        """
+        Manifest entries of the current segments after deleting the live
+        documents with doc_ids, writing their new deletes files, and the
+        deletes files those replace
+        """
+        live = self._live_docs()
+        deletes = {}
+        for doc_id in doc_ids:
+            entry = live.pop(str(doc_id), None)
+            if entry is not None:
+                deletes.setdefault(entry[0], []).append(entry[1])
+
+        entries = []
+        replaced = []
+        for segment in self.segments:
+            name = os.path.basename(segment.path)
+            if segment not in deletes:
+                entries.append((name, segment.deletes_name))
+                continue
+            deletes_name = self._next_deletes_name(name)
+            deleted = array('I', sorted(segment.deleted.union(
+                deletes[segment])))
+            if sys.byteorder != 'little':
+                deleted.byteswap()
+            with open(os.path.join(self.path, deletes_name), 'wb') as f:
+                f.write(deleted.tobytes())
+            entries.append((name, deletes_name))
+            if segment.deletes_name is not None:
+                replaced.append(segment.deletes_name)
+        return entries, replaced
+
+    def _publish(self, entries, obsolete=()):
+        """ Replace the manifest, reload it and drop files it no longer uses """
+        self._write_manifest(entries)
+        self.reload()
+        for name in obsolete:
+            os.remove(os.path.join(self.path, name))
+
+    def _live_docs(self):
+        """ {doc id: (segment, document number)} of every live document """
+        if self._live is None:
+            live = {}
+            for segment in self.segments:
+                for doc in range(len(segment)):
+                    if doc not in segment.deleted:
+                        live[segment.doc_id(doc)] = (segment, doc)
+            self._live = live
+        return self._live
+
+    def delete_documents(self, doc_ids):
+        """ Delete the live documents with these ids, ignoring unknown ids """
+        entries, replaced = self._with_deletes(doc_ids)
+        self._publish(entries, replaced)
+
+    def add_documents(self, documents):
+        """
+        Append (doc_id, {term: weight}) pairs as a new segment. A document
+        whose id is already live replaces it; within documents the last
+        pair of an id wins
+        """
+        latest = {}
+        documents = list(documents)
+        for position, (doc_id, _) in enumerate(documents):
+            latest[str(doc_id)] = position
+        documents = [document for position, document in enumerate(documents)
+                     if latest[str(document[0])] == position]
+
+        name = self._next_name()
+        if not write_segment(os.path.join(self.path, name), documents):
+            os.remove(os.path.join(self.path, name))
+            return
+        entries, replaced = self._with_deletes(latest)
+        self._publish(entries + [(name, None)], replaced)
+
+    def merge(self):
+        """
+        Rewrite all segments as one without the deleted documents and drop
+        the old files
+        """
+        if len(self.segments) < 2 and \
+           not any(segment.deleted for segment in self.segments):
+            return
+        doc_ids = []
+        postings = {}
+        for segment in self.segments:
+            # new number of every document of segment, None once deleted
+            numbers = []
+            for doc in range(len(segment)):
+                if doc in segment.deleted:
+                    numbers.append(None)
+                else:
+                    numbers.append(len(doc_ids))
+                    doc_ids.append(segment.doc_id(doc))
+            for term, docs, weights in segment.items():
+                entry = None
+                for doc, weight in zip(docs, weights):
+                    number = numbers[doc]
+                    if number is None:
+                        continue
+                    if entry is None:
+                        entry = postings.get(term)
+                        if entry is None:
+                            entry = postings[term] = (array('I'), array('f'))
+                    entry[0].append(number)
+                    entry[1].append(weight)
+
+        old = []
+        for segment in self.segments:
+            old.append(os.path.basename(segment.path))
+            if segment.deletes_name is not None:
+                old.append(segment.deletes_name)
+        name = self._next_name()
+        _write(os.path.join(self.path, name), doc_ids, postings)
+        self._publish([(name, None)], old)
+
+    def doc_id(self, doc):
+        for segment in self.segments:
+            if doc < len(segment):
+                return segment.doc_id(doc)
+            doc -= len(segment)
+        raise IndexError(doc)
+
+    def postings(self, term):
+        """ (docs, weights) of term across all segments, live documents only """
+        docs = array('I')
+        weights = array('f')
+        base = 0
+        for segment in self.segments:
+            entry = segment.postings(term)
+            if entry is not None:
+                for doc, weight in zip(*entry):
+                    if doc not in segment.deleted:
+                        docs.append(doc + base)
+                        weights.append(weight)
+            base += len(segment)
+        return docs, weights
+
+    def top_k(self, weights, k=10):
+        """
+        Top k (doc_id, score) for a {term: weight} query. MaxScore runs over
+        each segment in turn with bounds from that segment's term records,
+        carrying the heap and its threshold into the next segment
+        """
+        if k <= 0:
+            return []
+        terms = [(order, term, weights[term])
+                 for order, term in enumerate(sorted(weights))
+                 if weights[term] > 0]
+        heap = []
+        base = 0
+        for segment in self.segments:
+            lists = []
+            for order, term, query_weight in terms:
+                entry = segment.posting_list(term, base)
+                if entry is None:
+                    continue
+                max_weight, docs, doc_weights = entry
+                bound = query_weight * max_weight * BOUND_SLACK
+                lists.append((bound, order, query_weight, docs, doc_weights))
+            skip = None
+            if segment.deleted:
+                skip = set(doc + base for doc in segment.deleted)
+            heap = maxscore_top_k(lists, k, heap, skip)
+            base += len(segment)
+        return [(self.doc_id(-neg_doc), score) for score, neg_doc in
+                sorted(heap, key=lambda entry: (-entry[0], -entry[1]))]
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+if __name__ == "__main__":
+    import random
+    import shutil
+    import tempfile
+
+    from retrieval import InvertedIndex
+
+    rnd = random.Random(0)
+
+    def weight():
+        # dyadic weights survive float32 storage and sum exactly
+        return rnd.randint(1, 1024) / 1024.0
+
+    def document():
+        terms = set(int(rnd.paretovariate(1.2)) % 200
+                    for _ in range(rnd.randint(1, 30)))
+        return dict((t, weight()) for t in terms)
+
+    def check(stored, live, queries):
+        inverted = InvertedIndex()
+        for doc_id, weights in live:
+            inverted.add_document(doc_id, weights)
+        assert len(stored) == len(inverted)
+        for query, k in queries:
+            expected = [(str(doc_id), score)
+                        for doc_id, score in inverted.top_k(query, k)]
+            assert stored.top_k(dict((str(t), w) for t, w in query.items()),
+                                k) == expected
+
+    queries = [(dict((t, weight()) for t in rnd.sample(range(40),
+                                                       rnd.randint(1, 6))),
+                rnd.choice([1, 5, 10, 50]))
+               for _ in range(200)]
+    docs = [(n, document()) for n in range(3000)]
+
+    def stored_form(batch):
+        return [(doc_id, dict((str(t), w) for t, w in weights.items()))
+                for doc_id, weights in batch]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        index = SegmentedIndex(tmp)
+        for start in range(0, 3000, 1000):
+            index.add_documents(stored_form(docs[start:start + 1000]))
+        assert len(index.segments) == 3
+        check(index, docs, queries)
+
+        # round trip of one posting list through the varint blocks
+        expected = [doc for doc, weights in docs[:1000] if 1 in weights]
+        got, _ = index.segments[0].postings('1')
+        assert list(got) == expected
+        lazy = index.segments[0].posting_list('1')[1]
+        assert [lazy[i] for i in range(len(lazy))] == expected
+        assert lazy.seek(expected[300], 0) == 300
+        assert lazy.seek(expected[300] + 1, 0) == 301
+        assert lazy.seek(0, len(lazy)) == len(lazy)
+
+        # edited posts replace their previous copy, deletes are skipped
+        edited = [(n, document()) for n in range(0, 3000, 7)]
+        index.add_documents(stored_form(edited))
+        index.delete_documents([5, 11, 2999, 'unknown'])
+        replaced = set(n for n, _ in edited) | set([5, 11, 2999])
+        live = [(n, weights) for n, weights in docs if n not in replaced] \
+            + edited
+        check(index, live, queries)
+
+        # readers see the deletes after reload, and after a restart
+        reader = SegmentedIndex(tmp)
+        check(reader, live, queries)
+
+        # a writer dying before it publishes a replacement leaves the old
+        # copy as the only live one, never both
+        files = set(os.listdir(tmp))
+        publish = index._publish
+        index._publish = lambda *args: None
+        index.add_documents(stored_form([(n, document())
+                                         for n in range(0, 3000, 5)]))
+        index._publish = publish
+        orphans = set(os.listdir(tmp)) - files
+        assert orphans
+        for restarted in (reader, SegmentedIndex(tmp)):
+            restarted.reload()
+            check(restarted, live, queries)
+            restarted.close()
+        index.reload()
+
+        index.merge()
+        assert len(index.segments) == 1
+        assert not index.segments[0].deleted
+        merged = os.path.basename(index.segments[0].path)
+        assert set(os.listdir(tmp)) - orphans == set([MANIFEST, merged])
+        check(index, live, queries)
+        index.close()
+
+        reopened = SegmentedIndex(tmp)
+        check(reopened, live, queries)
+        assert reopened.top_k({'nonexistent': 1.0}) == []
+        assert reopened.top_k({'0': 1.0}, 0) == []
+        reopened.close()
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,200 @@
+"""
+Incremental feed sync: per user high-water marks and item content hashes
+kept in SQLite, so a refresh only processes new or changed items and an
+interrupted run resumes where it stopped
+"""
+
+import sqlite3
+
+from ingest import content_digest, item_content
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursors (
+    user_id TEXT PRIMARY KEY,
+    last_id TEXT,
+    last_updated TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    user_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    updated TEXT,
+    PRIMARY KEY (user_id, item_id)
+);
+"""
+
+
+def content_hash(item):
+    """ sha1 hex digest of the item's object.content """
+    return content_digest(item_content(item) or u'')
+
+
+def _timestamp(item):
+    # RFC 3339 strings from the activity feed compare in time order
+    return item.get('updated') or item.get('published')
+
+
+class FeedSync(object):
+    """
+    Tracks what has been processed for every user.
+
+        sync = FeedSync('feeds.sqlite')
+        for item in sync.pending(user_id, page['items']):
+            process(item)
+            sync.mark_done(user_id, item)
+        sync.finish(user_id)
+
+    mark_done records an item's content hash, committed every
+    checkpoint_every items, so a crash repeats at most that many items.
+    finish moves the user's high-water mark past everything seen in this
+    run; items older than the mark are skipped without hashing. The mark is
+    only moved once every pending item is done, because feeds list the
+    newest items first
+    """
+
+    def __init__(self, path, checkpoint_every=100):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+        self.checkpoint_every = checkpoint_every
+        self._uncommitted = 0
+        self._seen = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def cursor(self, user_id):
+        """ (last_id, last_updated) of user_id, or None before the first sync """
+        return self.db.execute(
+            "SELECT last_id, last_updated FROM cursors WHERE user_id = ?",
+            (user_id,)).fetchone()
+
+    def pending(self, user_id, items):
+        """ Yield the items of user_id that are new or whose content changed """
+        cursor = self.cursor(user_id)
+        last_updated = cursor[1] if cursor else None
+        newest = None
+        for item in items:
+            updated = _timestamp(item)
+            if updated and (newest is None or updated > newest[1]):
+                newest = (item.get('id'), updated)
+            if updated and last_updated and updated < last_updated:
+                continue
+
+            item_id = item.get('id') or content_hash(item)
+            row = self.db.execute(
+                "SELECT content_hash FROM items "
+                "WHERE user_id = ? AND item_id = ?",
+                (user_id, item_id)).fetchone()
+            if row is None or row[0] != content_hash(item):
+                yield item
+        if newest is not None:
+            self._seen[user_id] = newest
+
+    def mark_done(self, user_id, item):
+        item_hash = content_hash(item)
+        self.db.execute(
+            "INSERT OR REPLACE INTO items "
+            "(user_id, item_id, content_hash, updated) VALUES (?, ?, ?, ?)",
+            (user_id, item.get('id') or item_hash, item_hash,
+             _timestamp(item)))
+        self._uncommitted += 1
+        if self._uncommitted >= self.checkpoint_every:
+            self.checkpoint()
+
+    def finish(self, user_id):
+        """ Advance the high-water mark of user_id and checkpoint """
+        newest = self._seen.pop(user_id, None)
+        if newest is not None:
+            last_id, last_updated = newest
+            cursor = self.cursor(user_id)
+            if cursor is None or cursor[1] is None or last_updated > cursor[1]:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cursors "
+                    "(user_id, last_id, last_updated) VALUES (?, ?, ?)",
+                    (user_id, last_id, last_updated))
+        self.checkpoint()
+
+    def sync(self, user_id, items, process):
+        """ Call process(item) for every pending item of user_id """
+        count = 0
+        for item in self.pending(user_id, items):
+            process(item)
+            self.mark_done(user_id, item)
+            count += 1
+        self.finish(user_id)
+        return count
+
+    def checkpoint(self):
+        self.db.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.checkpoint()
+        self.db.close()
+
+
+if __name__ == "__main__":
+    import os
+    import shutil
+    import tempfile
+
+    def item(n, day, content=None):
+        return {'id': 'post-%d' % n,
+                'updated': '2026-10-%02dT00:00:00Z' % day,
+                'object': {'content': content or u'isi %d' % n}}
+
+    # feeds list the newest items first
+    page = [item(n, n) for n in range(9, 0, -1)]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'feeds.sqlite')
+
+        # a run interrupted after 5 items, 4 of them checkpointed
+        sync = FeedSync(path, checkpoint_every=2)
+        processed = []
+        for pending_item in sync.pending('u', page):
+            if len(processed) == 5:
+                break
+            processed.append(pending_item['id'])
+            sync.mark_done('u', pending_item)
+        sync.db.close()   # crash: no checkpoint, no finish
+
+        # the resumed run repeats the uncheckpointed item only
+        with FeedSync(path, checkpoint_every=2) as sync:
+            assert sync.cursor('u') is None
+            resumed = []
+            assert sync.sync('u', page,
+                             lambda i: resumed.append(i['id'])) == 5
+            assert resumed == [processed[-1]] + \
+                ['post-%d' % n for n in range(4, 0, -1)]
+            assert sync.cursor('u') == ('post-9', '2026-10-09T00:00:00Z')
+
+        # a restart against the same file skips everything already done
+        with FeedSync(path) as sync:
+            assert sync.cursor('u') == ('post-9', '2026-10-09T00:00:00Z')
+            assert list(sync.pending('u', page)) == []
+
+            # an edited item with a newer updated is processed again, a
+            # newer timestamp with the same content is not
+            edited = item(3, 12, u'isi baru')
+            touched = item(4, 11)
+            fresh = item(10, 10)
+            changed = [edited, touched, fresh] + page
+            assert [i['id'] for i in sync.pending('u', changed)] == \
+                ['post-3', 'post-10']
+            assert sync.sync('u', changed, lambda i: None) == 2
+            assert sync.cursor('u') == ('post-3', '2026-10-12T00:00:00Z')
+            assert list(sync.pending('u', changed)) == []
+
+            # an older copy of the edit no longer replaces it
+            assert list(sync.pending('u', [item(3, 3)])) == []
+
+            assert sync.cursor('other') is None
+            assert sync.sync('other', page[:2], lambda i: None) == 2
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,117 @@
+"""
+Interning vocabulary: every distinct stem is stored once and documents
+are kept as arrays of uint32 stem ids instead of lists of strings
+"""
+
+import os
+from array import array
+
+import numpy as np
+
+
+class Vocabulary(object):
+    """
+    Stem <-> integer id mapping. Ids are assigned consecutively in first
+    seen order and never change, so they can index arrays and matrix
+    columns directly
+    """
+
+    def __init__(self, terms=()):
+        self.ids = {}
+        self.terms = []
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.ids
+
+    def add(self, term):
+        """ Id of term, assigning the next one if it is new """
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def get(self, term, default=None):
+        return self.ids.get(term, default)
+
+    def term(self, term_id):
+        return self.terms[term_id]
+
+    def encode(self, tokens):
+        """ array('I') of the ids of tokens, interning new stems """
+        add = self.add
+        return array('I', [add(token) for token in tokens])
+
+    def lookup(self, tokens):
+        """ array('I') of the ids of the known tokens, skipping the others """
+        ids = self.ids
+        return array('I', [ids[token] for token in tokens if token in ids])
+
+    def decode(self, ids):
+        terms = self.terms
+        return [terms[term_id] for term_id in ids]
+
+    def decode_weights(self, weights):
+        """ {term: weight} of a {term id: weight} vector """
+        terms = self.terms
+        return dict((terms[term_id], weight)
+                    for term_id, weight in weights.items())
+
+    def save(self, path):
+        """ Write the terms, one per line in id order, replacing path """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(u''.join(term + u'\n' for term in self.terms))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(line.rstrip(u'\n') for line in f)
+
+
+def term_counts(ids):
+    """ (ids, counts) uint32 arrays of the distinct ids of a sequence, by id """
+    ids = np.frombuffer(ids, dtype=np.uint32) if isinstance(ids, array) \
+        else np.asarray(ids, dtype=np.uint32)
+    unique, counts = np.unique(ids, return_counts=True)
+    return unique.astype(np.uint32), counts.astype(np.uint32)
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'vocab.txt')
+        vocabulary = Vocabulary([u'makan', u'minum', u'kopi'])
+        ids = vocabulary.encode([u'kopi', u'teh', u'makan', u'éclair',
+                                 u'kue lapis', u'teh'])
+        assert list(ids) == [2, 3, 0, 4, 5, 3]
+
+        # ids survive a save / load round trip, including non ascii stems
+        vocabulary.save(path)
+        loaded = Vocabulary.load(path)
+        assert loaded.terms == vocabulary.terms
+        assert loaded.ids == vocabulary.ids
+        assert loaded.decode(ids) == vocabulary.decode(ids)
+        assert loaded.add(u'gula') == len(vocabulary)
+        assert not os.path.exists(path + '.tmp')
+
+        Vocabulary().save(path)
+        assert len(Vocabulary.load(path)) == 0
+
+        assert list(vocabulary.lookup([u'teh', u'gula', u'kopi'])) == [3, 2]
+        assert vocabulary.decode_weights({0: 0.5, 3: 1.0}) == \
+            {u'makan': 0.5, u'teh': 1.0}
+        unique, counts = term_counts(array('I', [3, 1, 3, 3]))
+        assert list(unique) == [1, 3] and list(counts) == [1, 3]
+        assert unique.dtype == counts.dtype == np.uint32
+    finally:
+        shutil.rmtree(tmp)